@@ -14,11 +14,16 @@
 from basic.counter import *
 from basic.database import *
 from basic.logger import *
+from basic.metrics import *
 from basic.variable import *
 
 __all__ = [
-    'Counter', 'GlobalCounter',
-    'MySQLDatabase',
+    'Counter', 'GlobalCounter', 'SharedCounter', 'ShardedCounter', 'GlobalShardedCounter',
+    'CONSISTENCY_RELAXED', 'CONSISTENCY_STRICT',
+    'ResultCache', 'ApproximateCount', 'PoolMetrics', 'MySQLDatabase', 'AsyncMySQLDatabase',
     'Logger', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL', 'WARN', 'FATAL',
-    'SyncVariable', 'GlobalSyncVariable',
+    'OVERFLOW_BLOCK', 'OVERFLOW_DROP_OLDEST', 'OVERFLOW_DROP_DEBUG', 'COMPRESSION_GZIP', 'COMPRESSION_ZSTD',
+    'iter_struct_log',
+    'Histogram', 'HdrHistogram', 'RateMeter', 'Timer', 'MetricsReporter', 'LATENCY_BUCKETS', 'prometheus_labels',
+    'SyncVariable', 'GlobalSyncVariable', 'SharedSyncVariable', 'LockedVariable', 'SnapshotVariable',
 ]
@@ -4,14 +4,25 @@
 @Author      : YongJie-Xie
 @Contact     : fsswxyj@qq.com
 @DateTime    : 0000-00-00 00:00
-@Description : 多线程同步计数类，基于多线程同步变量类实现。
+@Description : 多线程同步计数类，基于多线程同步变量类实现，支持线程局部分片计数、多进程共享内存计数。
 @FileName    : counter.py
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.1
+@Version     : 1.2
 """
-from basic.variable import SyncVariable, GlobalSyncVariable
+import contextlib
+import weakref
+from threading import Lock, local
+from typing import Iterator
+
+from basic.variable import SyncVariable, GlobalSyncVariable, SharedSyncVariable
+
+# ShardedCounter 的读取一致性模式
+# relaxed：读取时直接累加各线程的部分和，不阻塞写入，可能遗漏正在进行中的累加
+# strict：每个线程的部分和使用独立的锁（仅在读取时产生竞争），读取时获取全部锁得到一致的快照
+CONSISTENCY_RELAXED = 'relaxed'
+CONSISTENCY_STRICT = 'strict'
 
 
 class Counter(SyncVariable):
@@ -32,4 +43,115 @@ class GlobalCounter(GlobalSyncVariable):
             self._variable += value
 
 
-__all__ = ['Counter', 'GlobalCounter']
+class SharedCounter(SharedSyncVariable):
+    def __init__(self, default: int = 0, typecode: str = 'q', context=None):
+        super().__init__(default, typecode, context)
+
+    def increase(self, value: int = 1) -> None:
+        with self._variable_mutex:
+            self._slot[0] += value
+
+
+class _Cell:
+    """单个线程的部分和，仅由所属线程写入"""
+    __slots__ = ('value', 'mutex')
+
+    def __init__(self):
+        self.value = 0
+        self.mutex = Lock()
+
+
+class _Token:
+    """线程结束时随线程局部变量一同释放，用于触发部分和的回收"""
+    __slots__ = ('__weakref__',)
+
+
+class ShardedCounter(SyncVariable):
+    def __init__(self, default: int = 0, consistency: str = CONSISTENCY_RELAXED):
+        """
+        分片计数类，每个线程累加到线程局部的部分和中，读取时汇总，累加时不产生锁竞争
+        :param int default:
+            初始值
+        :param str consistency:
+            读取一致性模式，CONSISTENCY_RELAXED 或 CONSISTENCY_STRICT，默认值为 CONSISTENCY_RELAXED
+            注：relaxed 模式下 update、compare_and_set 等读-改-写操作不阻塞累加，期间其他线程的累加可能被覆盖
+        """
+        if consistency not in (CONSISTENCY_RELAXED, CONSISTENCY_STRICT):
+            raise ValueError('暂不支持的读取一致性模式')
+        super().__init__(default)
+        self._strict = consistency == CONSISTENCY_STRICT
+        self._cells = set()
+        self._local = local()
+
+    def increase(self, value: int = 1) -> None:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._register()
+        if self._strict:
+            with cell.mutex:
+                cell.value += value
+        else:
+            cell.value += value
+
+    def _register(self) -> _Cell:
+        cell, token = _Cell(), _Token()
+        with self._variable_mutex:
+            self._cells.add(cell)
+        self._local.cell, self._local.token = cell, token
+        # 线程结束后将部分和并入基础值，避免线程频繁创建销毁时部分和无限增长
+        weakref.finalize(token, ShardedCounter._retire, weakref.ref(self), cell)
+        return cell
+
+    @staticmethod
+    def _retire(reference: weakref.ref, cell: _Cell) -> None:
+        counter = reference()
+        if counter is None:
+            return
+        with counter._variable_mutex:
+            counter._cells.discard(cell)
+            counter._variable += cell.value
+
+    @contextlib.contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """strict 模式下同时持有全部部分和的锁，读取或读-改-写期间阻塞所有线程的累加"""
+        with self._variable_mutex:
+            cells = list(self._cells) if self._strict else ()
+            for cell in cells:
+                cell.mutex.acquire()
+            try:
+                yield
+            finally:
+                for cell in cells:
+                    cell.mutex.release()
+
+    def _load(self) -> int:
+        return self._variable + sum(cell.value for cell in list(self._cells))
+
+    def _store(self, value: int) -> None:
+        # 各线程的部分和只由所属线程写入，通过调整基础值实现赋值
+        self._variable += value - self._load()
+
+    @property
+    def variable(self) -> int:
+        with self._exclusive():
+            return self._load()
+
+    @variable.setter
+    def variable(self, value: int) -> None:
+        with self._exclusive():
+            self._store(value)
+
+    # set alias name
+    var = variable
+
+
+class GlobalShardedCounter(ShardedCounter, GlobalSyncVariable):
+    def __init__(self, default: int = 0, consistency: str = CONSISTENCY_RELAXED):
+        super().__init__(default, consistency)
+
+
+__all__ = [
+    'Counter', 'GlobalCounter', 'SharedCounter', 'ShardedCounter', 'GlobalShardedCounter',
+    'CONSISTENCY_RELAXED', 'CONSISTENCY_STRICT',
+]
@@ -9,12 +9,330 @@
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.1
+@Version     : 1.3
 """
+import asyncio
+import codecs
 import contextlib
-from typing import Union, List
+import copy
+import inspect
+import os
+import re
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+from threading import Lock, Thread
+from typing import AsyncIterator, Iterable, Iterator, Optional, Tuple, Union, List
 
-from basic.logger import Logger
+from basic.counter import Counter
+from basic.logger import Logger, DEBUG
+from basic.metrics import Histogram, prometheus_labels
+
+# 写入时需要转义的字符，转义后占用两个字节
+_ESCAPED = re.compile('[\x00\n\r\x1a\'"\\\\]')
+_ESCAPED_BYTES = re.compile(b'[\x00\n\r\x1a\'"\\\\]')
+
+# 会隐式提交当前事务的 DDL 语句（临时表的创建及删除除外）
+_IMPLICIT_COMMIT = re.compile(r'\s*(?:ALTER|RENAME|TRUNCATE|(?:CREATE|DROP)(?!\s+TEMPORARY\b))\b', re.IGNORECASE)
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, ttl: float = 60, table_ttl: dict = None) -> None:
+        """
+        查询结果缓存类 ResultCache，按（语句, 参数）缓存查询结果，按估算字节数进行 LRU 淘汰，
+        写入及读取时复制结果中的列表、字典及数组，调用方修改返回结果不影响缓存
+        :param int max_bytes:
+            缓存结果的估算字节数上限，超过时淘汰最久未使用的结果
+        :param float ttl:
+            缓存结果的默认有效秒数，为 0 表示不缓存
+        :param dict table_ttl:
+            按表名单独指定的有效秒数，例如 {'tmp_test_script': 300}
+        """
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._table_ttl = table_ttl or {}
+        self._entries = OrderedDict()  # key -> (table, expire, size, value)
+        self._tables = {}  # table -> {key, ...}
+        self._generations = {}  # table -> 失效次数，用于丢弃写入期间读取到的旧结果
+        self._epoch = 0  # 清空全部缓存的次数，查询期间清空全部缓存时同样丢弃结果
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = self._invalidations = 0
+        self._mutex = Lock()
+
+    def get(self, key: tuple) -> Tuple[bool, object]:
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return True, self._copy(entry[3])
+
+    def generation(self, table: str) -> tuple:
+        return self._epoch, self._generations.get(table, 0)
+
+    def put(self, table: str, key: tuple, value: object, generation: tuple) -> None:
+        """写入缓存结果，查询期间该表已失效、全部缓存已清空或结果超过字节数上限时不缓存"""
+        ttl = self._table_ttl.get(table, self._ttl)
+        if ttl <= 0:
+            return
+        size = self._sizeof(value)
+        if size > self._max_bytes:
+            return
+        value = self._copy(value)
+        with self._mutex:
+            if (self._epoch, self._generations.get(table, 0)) != generation:
+                return
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (table, time.monotonic() + ttl, size, value)
+            self._tables.setdefault(table, set()).add(key)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                self._discard(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, table: str = None) -> None:
+        """使指定表的缓存结果失效，table 为 None 时清空全部缓存"""
+        with self._mutex:
+            if table is None:
+                self._epoch += 1
+                self._entries.clear()
+                self._tables.clear()
+                self._bytes = 0
+            else:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in self._tables.pop(table, ()):
+                    entry = self._entries.pop(key)
+                    self._bytes -= entry[2]
+            self._invalidations += 1
+
+    def info(self) -> dict:
+        """缓存的命中次数、未命中次数、命中率、淘汰次数、失效次数、结果数量及估算字节数"""
+        with self._mutex:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits, 'misses': self._misses, 'hit_ratio': self._hits / total if total else 0.0,
+                'evictions': self._evictions, 'invalidations': self._invalidations,
+                'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self._max_bytes,
+            }
+
+    def _discard(self, key: tuple) -> None:
+        table, _, size, _ = self._entries.pop(key)
+        keys = self._tables[table]
+        keys.discard(key)
+        if not keys:
+            del self._tables[table]
+        self._bytes -= size
+
+    @classmethod
+    def _copy(cls, value: object) -> object:
+        """
+        复制结果中的列表、字典及数组（array.array 及 NumPy 数组），元组中的行为字典或列表时逐行复制
+        （例如 DictCursor 的 fetchall 返回字典组成的元组），其余元组及标量不可变，原样共享
+        """
+        if isinstance(value, list):
+            if value and isinstance(value[0], (list, dict)):
+                return [cls._copy(item) for item in value]
+            return list(value)
+        if isinstance(value, tuple):
+            if value and isinstance(value[0], (list, dict)):
+                return tuple(cls._copy(item) for item in value)
+            return value
+        if isinstance(value, dict):
+            return {key: cls._copy(item) for key, item in value.items()}
+        if isinstance(value, array) or hasattr(value, '__array_interface__'):
+            return copy.copy(value)
+        return value
+
+    @classmethod
+    def _sizeof(cls, value: object) -> int:
+        """估算结果占用的字节数（array.array 及 NumPy 数组的 getsizeof 已包含数据缓冲区）"""
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(cls._sizeof(k) + cls._sizeof(v) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(cls._sizeof(item) for item in value)
+        return sys.getsizeof(value)
+
+
+class ApproximateCount(int):
+    """
+    近似行数，staleness 为结果可能滞后的秒数上限，source 为结果来源（counter 或 information_schema），
+    source 为 information_schema 且 staleness 为 0 时表示服务端不支持统计信息缓存时间，滞后时间没有上限
+    """
+
+    def __new__(cls, value: int, staleness: float, source: str) -> 'ApproximateCount':
+        self = super().__new__(cls, value)
+        self.staleness = staleness
+        self.source = source
+        return self
+
+    def __repr__(self) -> str:
+        return 'ApproximateCount({}, staleness={:.3f}, source={!r})'.format(int(self), self.staleness, self.source)
+
+
+class PoolMetrics:
+    def __init__(self, pool: object, prefix: str = 'mysql') -> None:
+        """
+        连接池指标统计类 PoolMetrics，统计连接池状态、获取连接的等待耗时、按（方法, 表名）统计的查询耗时及错误次数
+        :param object pool:
+            PooledDB 或 PersistentDB 连接池对象
+        :param str prefix:
+            Prometheus 指标名称前缀，默认值为 mysql
+        """
+        self._pool = pool
+        self._prefix = prefix
+        self._wait = Histogram()
+        self._waiting = Counter()
+        self._checkouts = Counter()
+        self._queries = {}  # (method, table) -> Histogram
+        self._errors = {}  # (method, table) -> Counter
+        self._mutex = Lock()
+
+    def connection(self) -> object:
+        """从连接池获取连接，并记录等待耗时及等待中的线程数量"""
+        self._waiting.increase()
+        start = time.perf_counter()
+        try:
+            connect = self._pool.connection()
+        except Exception:
+            self.error(('connection', ''))
+            raise
+        finally:
+            self._wait.observe(time.perf_counter() - start)
+            self._waiting.increase(-1)
+        self._checkouts.increase()
+        return connect
+
+    def observe(self, metric: Tuple[str, str], seconds: float) -> None:
+        histogram = self._queries.get(metric)
+        if histogram is None:
+            with self._mutex:
+                histogram = self._queries.setdefault(metric, Histogram())
+        histogram.observe(seconds)
+
+    def error(self, metric: Tuple[str, str]) -> None:
+        counter = self._errors.get(metric)
+        if counter is None:
+            with self._mutex:
+                counter = self._errors.setdefault(metric, Counter())
+        counter.increase()
+
+    def pool_stats(self) -> dict:
+        """连接池状态：连接总数、最大连接数、空闲连接数、使用中连接数、共享连接数及其使用者数量、等待中的线程数量"""
+        stats = {'waiting': self._waiting.variable, 'checkouts': self._checkouts.variable}
+        # 连接池状态读取自 PooledDB 的内部属性，PersistentDB 或 DBUtils 版本变更导致属性缺失时仅返回上述统计
+        pool = self._pool
+        lock, idle_cache = getattr(pool, '_lock', None), getattr(pool, '_idle_cache', None)
+        max_connections = getattr(pool, '_maxconnections', None)
+        if lock is None or idle_cache is None or max_connections is None or not hasattr(pool, '_connections'):
+            return stats
+        with lock:
+            idle, in_use = len(idle_cache), getattr(pool, '_connections', 0)
+            shared_cache = getattr(pool, '_shared_cache', None) or ()
+            shared, shared_users = len(shared_cache), sum(getattr(con, 'shared', 0) for con in shared_cache)
+        stats.update({
+            'size': idle + in_use, 'max_connections': max_connections,
+            'idle': idle, 'in_use': in_use, 'shared': shared, 'shared_users': shared_users,
+        })
+        return stats
+
+    def snapshot(self) -> dict:
+        with self._mutex:
+            queries, errors = dict(self._queries), dict(self._errors)
+        return {
+            'pool': self.pool_stats(),
+            'wait': self._wait.snapshot(),
+            'queries': {metric: histogram.snapshot() for metric, histogram in queries.items()},
+            'errors': {metric: counter.variable for metric, counter in errors.items()},
+        }
+
+    def prometheus(self) -> str:
+        """按 Prometheus 文本格式输出全部指标"""
+        prefix, stats = self._prefix, self.pool_stats()
+        with self._mutex:
+            queries, errors = sorted(self._queries.items()), sorted(self._errors.items())
+        lines = [
+            '# HELP {}_pool_connections Pool connections by state.'.format(prefix),
+            '# TYPE {}_pool_connections gauge'.format(prefix),
+        ]
+        for state in ('idle', 'in_use', 'shared'):
+            if state in stats:
+                lines.append('{}_pool_connections{} {}'.format(
+                    prefix, prometheus_labels({'state': state}), stats[state]))
+        for name, key, kind, text in (
+                ('pool_max_connections', 'max_connections', 'gauge', 'Maximum pool connections, 0 for unlimited.'),
+                ('pool_waiting_threads', 'waiting', 'gauge', 'Threads waiting for a pool connection.'),
+                ('pool_checkouts_total', 'checkouts', 'counter', 'Connections checked out of the pool.'),
+        ):
+            if key in stats:
+                lines.extend(('# HELP {}_{} {}'.format(prefix, name, text),
+                              '# TYPE {}_{} {}'.format(prefix, name, kind),
+                              '{}_{} {}'.format(prefix, name, stats[key])))
+        lines.extend(('# HELP {}_pool_wait_seconds Time spent waiting for a pool connection.'.format(prefix),
+                      '# TYPE {}_pool_wait_seconds histogram'.format(prefix)))
+        lines.extend(self._wait.prometheus('{}_pool_wait_seconds'.format(prefix)))
+        lines.extend(('# HELP {}_query_duration_seconds Query latency by method and table.'.format(prefix),
+                      '# TYPE {}_query_duration_seconds histogram'.format(prefix)))
+        for (method, table), histogram in queries:
+            lines.extend(histogram.prometheus(
+                '{}_query_duration_seconds'.format(prefix), {'method': method, 'table': table}))
+        lines.extend(('# HELP {}_query_errors_total Query errors by method and table.'.format(prefix),
+                      '# TYPE {}_query_errors_total counter'.format(prefix)))
+        for (method, table), counter in errors:
+            lines.append('{}_query_errors_total{} {}'.format(
+                prefix, prometheus_labels({'method': method, 'table': table}), counter.variable))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, filename: str) -> None:
+        """写入 Prometheus 文本格式文件（先写入临时文件再替换，适用于 node_exporter 的 textfile 收集器）"""
+        temporary = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(temporary, 'w', encoding='utf-8') as file:
+            file.write(self.prometheus())
+        os.replace(temporary, filename)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """在后台线程中启动 HTTP 服务，通过 GET 请求返回 Prometheus 文本格式指标，返回的服务对象可调用 shutdown 停止"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+        return server
+
+
+class _Session:
+    """会话状态：共享的连接及游标、是否处于事务中、事务中写入的表、保存点嵌套深度及外层的查询结果缓存"""
+    __slots__ = ('connect', 'cursor', 'transaction', 'tables', 'depth', 'cache')
+
+    def __init__(self, connect: object, cursor: object, cache: Optional[ResultCache]) -> None:
+        self.connect = connect
+        self.cursor = cursor
+        self.transaction = False
+        self.tables = set()
+        self.depth = 0
+        self.cache = cache
 
 
 class MySQLDatabase:
@@ -41,6 +359,12 @@ class MySQLDatabase:
             reset: bool = True,
             multi_thread: bool = True,
             logger: Logger = None,
+            log_params_limit: int = 10,
+            statement_cache_size: int = 1024,
+            cache_max_bytes: int = 0,
+            cache_ttl: float = 60,
+            cache_table_ttl: dict = None,
+            metrics: bool = False,
             **kwargs
     ) -> None:
         """
@@ -92,9 +416,34 @@ class MySQLDatabase:
             是否多线程调用，多线程则用 PooledDB 模块，否则使用 PersistentDB 模块，默认值 True
         :param Logger logger:
             日志对象
+        :param int log_params_limit:
+            executemany 调试日志中参数序列（seq_params）的截断数量，超过时仅输出前若干项及总数、估算字节数，
+            单条语句的参数不截断，为 0 表示不截断，默认值为 10
+        :param int statement_cache_size:
+            增删改查语句的 LRU 缓存数量，为 None 表示不限制，默认值为 1024
+        :param int cache_max_bytes:
+            select_all 及 count 查询结果缓存的估算字节数上限，为 0 表示不缓存，默认值为 0
+            注：通过本对象执行 insert_*、update、delete、drop_table 时自动使对应表的缓存失效
+        :param float cache_ttl:
+            查询结果缓存的默认有效秒数，默认值为 60
+        :param dict|None cache_table_ttl:
+            按表名单独指定的查询结果缓存有效秒数，为 0 表示该表不缓存，例如 {'tmp_test_script': 300}
+        :param bool metrics:
+            连接池及查询耗时指标的统计开关，参考 PoolMetrics，默认值为 False
         """
         # 初始化日志对象
         self._logger = logger or Logger('MySQLDatabase')
+        self._log_params_limit = log_params_limit
+        self._max_allowed_packet = None
+        self._cache = ResultCache(cache_max_bytes, cache_ttl, cache_table_ttl) if cache_max_bytes else None
+        self._stats_expiry = None
+        # 通过 track_count 跟踪行数的表：{(数据库名, 表名)}，未精确计数的表在下次查询时计数
+        self._tracked_counts = set()
+        # 增量维护行数的表：(数据库名, 表名) -> (计数器, 精确计数的时间)，未初始化或需要重新计数的表不在字典中
+        self._row_counters = {}
+        # 精确计数进行中的表：(数据库名, 表名) -> 期间写入的行数增量，为 None 表示期间的写入无法确定变化量
+        self._pending_counts = {}
+        self._count_mutex = Lock()
 
         # 生成数据库配置
         if creator.__name__ == 'MySQLdb':
@@ -116,6 +465,11 @@ class MySQLDatabase:
 
         if cursor_class is not None:
             self._config['cursorclass'] = cursor_class
+        # 估算分块字节数时使用的编码，utf8、utf8mb4 等 MySQL 字符集名称不是 Python 编码名称时按 UTF-8 估算
+        try:
+            self._encoding = codecs.lookup(charset).name
+        except LookupError:
+            self._encoding = 'utf-8'
 
         # DBUtils 是一套 Python 数据库连接池包，并允许对非线程安全的数据库接口进行线程安全包装。
         # DBUtils 提供两种外部接口：
@@ -140,52 +494,259 @@ class MySQLDatabase:
                 **self._config, **kwargs
             )
 
+        self._metrics = PoolMetrics(self._pool) if metrics else None
+        # 会话状态，仅在 session 返回的会话对象中不为 None
+        self._session = None
+        # mysql.connector 的连接没有 begin 方法，需显式执行开启事务语句
+        self._begin_operation = 'START TRANSACTION;' if creator.__name__ == 'mysql.connector' else None
+
         # 辅助函数（s -> 字符串）（x -> 元组）（sy -> 占位符）（sp -> 间隔符）
         self._wrapper = lambda s, sy='`%s`': sy % s  # 'test' -> '`test`'
         self._placeholder = lambda x, sy='%s', sp=', ': sp.join([sy] * len(x))  # '(1, 2)' -> '%s, %s'
         self._placeholder_plus = lambda x, sy='`%s`', sp=', ': (sp.join([sy] * len(x)) % x)  # '(1, 2)' -> '`%s`, `%s`'
 
+        # 按（语句类型, 表名, 列名, 数据库名）缓存生成的 SQL 语句
+        self._statement = lru_cache(maxsize=statement_cache_size)(self._build_statement)
+
+    def _connection(self) -> object:
+        return self._pool.connection() if self._metrics is None else self._metrics.connection()
+
+    def metrics_snapshot(self) -> Optional[dict]:
+        """连接池状态、获取连接的等待耗时、按（方法, 表名）统计的查询耗时及错误次数，未启用时返回 None"""
+        return self._metrics.snapshot() if self._metrics is not None else None
+
+    def export_metrics(self, filename: str = None) -> Optional[str]:
+        """返回 Prometheus 文本格式的指标，指定 filename 时同时写入文件，未启用时返回 None"""
+        if self._metrics is None:
+            return None
+        if filename is not None:
+            self._metrics.export(filename)
+        return self._metrics.prometheus()
+
+    def serve_metrics(self, port: int, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+        """启动 Prometheus 文本格式指标的 HTTP 服务，参考 PoolMetrics.serve，未启用时返回 None"""
+        return self._metrics.serve(port, host) if self._metrics is not None else None
+
+    def _build_statement(
+            self, kind: str, table: str, columns: tuple, database: Optional[str], values: tuple = ()
+    ) -> str:
+        """SQL 语句生成函数（由 _statement 按调用形态缓存）"""
+        database = '{}.'.format(self._wrapper(database)) if database else ''
+        table = self._wrapper(table)
+        if kind == 'insert_one':
+            return 'INSERT INTO {}{} ({}) VALUE ({});'.format(
+                database, table, self._placeholder_plus(columns), self._placeholder(columns))
+        if kind == 'insert_all':
+            return 'INSERT INTO {}{} ({}) VALUES ({});'.format(
+                database, table, self._placeholder_plus(columns), self._placeholder(columns))
+        if kind == 'delete':
+            return 'DELETE FROM {}{} WHERE {};'.format(
+                database, table, self._placeholder_plus(columns, sy='`%s` = %%s', sp=' AND '))
+        if kind == 'select':
+            return 'SELECT {} FROM {}{};'.format(
+                self._placeholder_plus(columns) if columns else '*', database, table)
+        if kind == 'scan':
+            return 'SELECT {} FROM {}{} WHERE {} > %s ORDER BY {} LIMIT %s;'.format(
+                self._placeholder_plus(columns) if columns else '*', database, table,
+                self._wrapper(values[0]), self._wrapper(values[0]))
+        if kind == 'scan_first':
+            return 'SELECT {} FROM {}{} ORDER BY {} LIMIT %s;'.format(
+                self._placeholder_plus(columns) if columns else '*', database, table, self._wrapper(values[0]))
+        if kind == 'update':
+            return 'UPDATE {}{} SET {} WHERE {};'.format(
+                database, table, self._placeholder_plus(values, sy='`%s` = %%s'),
+                self._placeholder_plus(columns, sy='`%s` = %%s', sp=' AND '))
+        if kind == 'count':
+            return 'SELECT COUNT({}) FROM {}{};'.format(
+                self._wrapper(columns[0]) if columns else '*', database, table)
+        raise ValueError('暂不支持的语句类型')
+
+    def statement_cache_info(self):
+        """语句缓存的命中次数、未命中次数、最大数量及当前数量"""
+        return self._statement.cache_info()
+
+    def cache_info(self) -> Optional[dict]:
+        """查询结果缓存的统计信息，参考 ResultCache.info，未启用时返回 None"""
+        return self._cache.info() if self._cache is not None else None
+
+    def invalidate_cache(self, table: str = None) -> None:
+        """使指定表的查询结果缓存失效，table 为 None 时清空全部缓存（适用于绕过本对象写入的场景）"""
+        if self._session is not None and self._session.transaction:
+            # 事务中的写入在提交或回滚后才使缓存失效，避免其他线程在提交前重新缓存旧结果
+            self._session.tables.add(table)
+        elif self._cache is not None:
+            self._cache.invalidate(table)
+
+    @contextlib.contextmanager
+    def session(self, transaction: bool = True) -> 'MySQLDatabase':
+        """
+        with database.session() as session:
+            session.insert_one('tmp_test_script', ('a1', 'b2', 'c3'), ('1', '2', '3'))
+            with session.session():  <-- SAVEPOINT
+                session.delete('tmp_test_script', ('a1', 'b2', 'c3'), ('1', '2', '3'))
+        返回在同一个连接及游标上执行语句的会话对象（仅限当前线程使用），transaction 为 True 时开启事务，
+        正常退出时提交，发生异常时回滚；在会话对象上嵌套调用时使用保存点，异常时仅回滚到保存点；
+        会话中逐条或分批查询的结果未读取完毕前不能执行其他语句，bulk_load 及 create_table、drop_table 等
+        会隐式提交的 DDL 语句不能在事务中调用，事务期间不读写查询结果缓存
+        """
+        if self._session is not None:
+            yield from self._nested_session(transaction)
+            return
+
+        connect = self._connection()
+        cursor = connect.cursor()
+        session = copy.copy(self)
+        session._session = _Session(connect, cursor, self._cache)
+        try:
+            if transaction:
+                session._begin()
+            yield session
+            if session._session.transaction:
+                session._finish(commit=True)
+        except BaseException:
+            if session._session.transaction:
+                session._finish(commit=False)
+            raise
+        finally:
+            cursor.close()
+            connect.close()
+
+    def _nested_session(self, transaction: bool) -> Iterator['MySQLDatabase']:
+        state = self._session
+        if not transaction:
+            yield self
+        elif not state.transaction:
+            # 外层会话未开启事务时，在共享连接上开启事务并在退出时提交
+            self._begin()
+            try:
+                yield self
+            except BaseException:
+                self._finish(commit=False)
+                raise
+            self._finish(commit=True)
+        else:
+            state.depth += 1
+            savepoint = 'sp_{}'.format(state.depth)
+            state.cursor.execute('SAVEPOINT {};'.format(savepoint))
+            try:
+                yield self
+                state.cursor.execute('RELEASE SAVEPOINT {};'.format(savepoint))
+            except BaseException:
+                state.cursor.execute('ROLLBACK TO SAVEPOINT {};'.format(savepoint))
+                self._discard_counts()
+                raise
+            finally:
+                state.depth -= 1
+
+    def _begin(self) -> None:
+        state = self._session
+        # 通过 DBUtils 的 begin 标记事务，事务期间连接不会被透明地替换
+        state.connect.begin()
+        if self._begin_operation is not None:
+            state.cursor.execute(self._begin_operation)
+        state.transaction = True
+        self._cache = None
+
+    def _finish(self, commit: bool) -> None:
+        """提交或回滚事务，并使事务中写入的表的查询结果缓存失效"""
+        state = self._session
+        try:
+            if commit:
+                state.connect.commit()
+            else:
+                with contextlib.suppress(Exception):
+                    state.connect.rollback()
+                self._discard_counts()
+        finally:
+            state.transaction = False
+            self._cache = state.cache
+            for table in state.tables:
+                self.invalidate_cache(table)
+            state.tables.clear()
+
+    def _discard_counts(self) -> None:
+        """回滚后事务中写入的表的增量行数不再准确，下次查询时重新精确计数"""
+        tables = self._session.tables
+        for key in list(self._tracked_counts):
+            if key[1] in tables or None in tables:
+                self._reset_count(key)
+
+    def _summarize(self, seq_params: Union[dict, tuple, list, None]) -> str:
+        """参数序列摘要函数（超过截断数量时仅输出前若干行，并附带总行数及估算字节数）"""
+        if not isinstance(seq_params, (tuple, list)) or not 0 < self._log_params_limit < len(seq_params):
+            return str(seq_params)
+        head = seq_params[:self._log_params_limit]
+        # 按已输出部分的平均长度估算全部参数的字节数，避免将整个参数序列转换为字符串
+        size = sum(len(str(row)) for row in head) * len(seq_params) // len(head)
+        return '{} ... (total: {} items, about {} bytes)'.format(head, len(seq_params), size)
+
     @contextlib.contextmanager
     def execute(
             self, operation: str,
             *,
             params: Union[dict, tuple, list] = None, cursor_class: type = None,
-            stacklevel: int = 4
+            metric: Tuple[str, str] = ('execute', ''), stacklevel: int = 4
     ) -> type:
-        self._logger.debug('Execute operation: {}'.format(operation), stacklevel=stacklevel)
-        self._logger.debug('Execute params: {}'.format(params), stacklevel=stacklevel)
-        connect = self._pool.connection()
-        cursor = connect.cursor(cursorclass=cursor_class)
+        if self._logger.logger.isEnabledFor(DEBUG):
+            self._logger.debug('Execute operation: %s', operation, stacklevel=stacklevel)
+            self._logger.debug('Execute params: %s', params, stacklevel=stacklevel)
+        if self._session is None:
+            connect = self._connection()
+            cursor = connect.cursor(cursorclass=cursor_class)
+        else:
+            if self._session.transaction and _IMPLICIT_COMMIT.match(operation):
+                raise RuntimeError('DDL 语句会隐式提交当前事务，不能在事务中执行，请在事务外或 session(transaction=False) 中执行')
+            connect, cursor = None, self._session.cursor
         try:
-            cursor.execute(operation, params)
+            if self._metrics is None:
+                cursor.execute(operation, params)
+            else:
+                start = time.perf_counter()
+                cursor.execute(operation, params)
+                self._metrics.observe(metric, time.perf_counter() - start)
             yield cursor
         except Exception as e:
-            self._logger.exception('Execute error: {}'.format(e), stacklevel=stacklevel)
+            if self._metrics is not None:
+                self._metrics.error(metric)
+            self._logger.exception('Execute error: %s', e, stacklevel=stacklevel)
             raise e
         finally:
-            cursor.close()
-            connect.close()
+            if connect is not None:
+                cursor.close()
+                connect.close()
 
     @contextlib.contextmanager
     def executemany(
             self, operation: str,
             *,
             seq_params: Union[dict, tuple, list], cursor_class: type = None,
-            stacklevel: int = 4
+            metric: Tuple[str, str] = ('executemany', ''), stacklevel: int = 4
     ) -> type:
-        self._logger.debug('Executemany operation: {}'.format(operation), stacklevel=stacklevel)
-        self._logger.debug('Executemany seq_params: {}'.format(seq_params), stacklevel=stacklevel)
-        connect = self._pool.connection()
-        cursor = connect.cursor(cursorclass=cursor_class)
+        if self._logger.logger.isEnabledFor(DEBUG):
+            self._logger.debug('Executemany operation: %s', operation, stacklevel=stacklevel)
+            self._logger.debug('Executemany seq_params: %s', self._summarize(seq_params), stacklevel=stacklevel)
+        if self._session is None:
+            connect = self._connection()
+            cursor = connect.cursor(cursorclass=cursor_class)
+        else:
+            connect, cursor = None, self._session.cursor
         try:
-            cursor.executemany(operation, seq_params)
+            if self._metrics is None:
+                cursor.executemany(operation, seq_params)
+            else:
+                start = time.perf_counter()
+                cursor.executemany(operation, seq_params)
+                self._metrics.observe(metric, time.perf_counter() - start)
             yield cursor
         except Exception as e:
-            self._logger.exception('Executemany error: {}'.format(e), stacklevel=stacklevel)
+            if self._metrics is not None:
+                self._metrics.error(metric)
+            self._logger.exception('Executemany error: %s', e, stacklevel=stacklevel)
             raise e
         finally:
-            cursor.close()
-            connect.close()
+            if connect is not None:
+                cursor.close()
+                connect.close()
 
     def create_table(self, table: str, columns_info: dict, ignore: bool = True, database: str = None):
         """
@@ -201,7 +762,7 @@ class MySQLDatabase:
             table=self._wrapper(table),
             columns=self._placeholder_plus(keys, sy='`%s` %%s') % values
         )
-        with self.execute(operation, stacklevel=5) as cur:
+        with self.execute(operation, metric=('create_table', table), stacklevel=5) as cur:
             rowcount = cur.rowcount
         return rowcount
 
@@ -215,8 +776,10 @@ class MySQLDatabase:
             database='{}.'.format(self._wrapper(database)) if database else '',
             table=self._wrapper(table)
         )
-        with self.execute(operation, stacklevel=5) as cur:
+        with self.execute(operation, metric=('drop_table', table), stacklevel=5) as cur:
             rowcount = cur.rowcount
+        self.invalidate_cache(table)
+        self._reset_count((database, table))
         return rowcount
 
     def insert_one(self, table: str, columns: tuple, params: tuple, database: str = None) -> int:
@@ -224,14 +787,11 @@ class MySQLDatabase:
         sql = 'INSERT INTO `tmp_test_script` (`a1`, `b2`, `c3`) VALUE (%s, %s, %s);'
         rowcount = database.insert_one('tmp_test_script', ('a1', 'b2', 'c3'), ('1', '2', '3'))
         """
-        operation = 'INSERT INTO {database}{table} ({columns}) VALUE ({params});'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            columns=self._placeholder_plus(columns),
-            params=self._placeholder(columns)
-        )
-        with self.execute(operation, params=params, stacklevel=5) as cur:
+        operation = self._statement('insert_one', table, tuple(columns), database)
+        with self.execute(operation, params=params, metric=('insert_one', table), stacklevel=5) as cur:
             rowcount = cur.rowcount
+        self.invalidate_cache(table)
+        self._adjust_count(table, database, rowcount)
         return rowcount
 
     def insert_all(self, table: str, columns: tuple, seq_params: List[tuple], database: str = None) -> int:
@@ -239,28 +799,231 @@ class MySQLDatabase:
         sql = 'INSERT INTO `tmp_test_script` (`a1`, `b2`, `c3`) VALUES (%s, %s, %s);'
         rowcount = database.insert_all('tmp_test_script', ('a1', 'b2', 'c3'), [("4", "5", "6"), ("7", "8", "9")])
         """
-        operation = 'INSERT INTO {database}{table} ({columns}) VALUES ({params});'.format(
+        operation = self._statement('insert_all', table, tuple(columns), database)
+        with self.executemany(operation, seq_params=seq_params, metric=('insert_all', table), stacklevel=5) as cur:
+            rowcount = cur.rowcount
+        self.invalidate_cache(table)
+        self._adjust_count(table, database, rowcount)
+        return rowcount
+
+    def insert_bulk(
+            self, table: str, columns: tuple, rows: Iterable[tuple], chunk_rows: int = 1000, chunk_bytes: int = None,
+            ignore: bool = False, update_columns: tuple = None, database: str = None
+    ) -> int:
+        """
+        sql = 'INSERT INTO `tmp_test_script` (`a1`, `b2`, `c3`) VALUES (%s, %s, %s), (%s, %s, %s), ...;'
+        rowcount = database.insert_bulk('tmp_test_script', ('a1', 'b2', 'c3'), ((str(i), '5', '6') for i in range(9)))
+        按行数及估算字节数将任意可迭代对象分块，每块生成一条多行 INSERT 语句并单独提交，
+        chunk_bytes 默认取服务端 max_allowed_packet 的一半，ignore 为 True 时使用 INSERT IGNORE，
+        update_columns 不为空时追加 ON DUPLICATE KEY UPDATE 更新指定列
+        """
+        prefix, suffix, row_placeholder = self._insert_bulk_template(table, columns, ignore, update_columns, database)
+        if chunk_bytes is None:
+            chunk_bytes = self.max_allowed_packet() // 2
+        row_bytes = chunk_bytes - len((prefix + suffix).encode(self._encoding))
+
+        operations = {}
+        rowcount, total, start = 0, 0, time.perf_counter()
+        if self._session is None:
+            connect = self._connection()
+            cursor = connect.cursor()
+        else:
+            connect, cursor = self._session.connect, self._session.cursor
+        # 事务中由事务统一提交，否则每块单独提交
+        commit = self._session is None or not self._session.transaction
+        try:
+            for chunk in self._chunk(rows, chunk_rows, row_bytes, self._encoding):
+                if len(chunk) not in operations:
+                    operations[len(chunk)] = prefix + ', '.join([row_placeholder] * len(chunk)) + suffix
+                chunk_start = time.perf_counter()
+                cursor.execute(operations[len(chunk)], [value for row in chunk for value in row])
+                if commit:
+                    connect.commit()
+                if self._metrics is not None:
+                    self._metrics.observe(('insert_bulk', table), time.perf_counter() - chunk_start)
+                rowcount += cursor.rowcount
+                total += len(chunk)
+                self._logger.debug(
+                    'Insert bulk progress: %s rows, %.0f rows/sec', total, total / (time.perf_counter() - start),
+                    stacklevel=3)
+        except Exception as e:
+            if self._metrics is not None:
+                self._metrics.error(('insert_bulk', table))
+            self._logger.exception('Insert bulk error: %s', e, stacklevel=3)
+            raise e
+        finally:
+            if self._session is None:
+                cursor.close()
+                connect.close()
+            self.invalidate_cache(table)
+            self._adjust_count(table, database, None if update_columns else rowcount)
+        elapsed = time.perf_counter() - start
+        self._logger.info(
+            'Insert bulk finished: %s rows in %.3f sec, %.0f rows/sec',
+            total, elapsed, total / elapsed if elapsed else 0, stacklevel=3)
+        return rowcount
+
+    def bulk_load(
+            self, table: str, columns: tuple, rows: Iterable[tuple], workers: int = 4, chunk_rows: int = 1000,
+            chunk_bytes: int = None, retries: int = 3, ignore: bool = False, update_columns: tuple = None,
+            database: str = None
+    ) -> int:
+        """
+        sql = 'INSERT INTO `tmp_test_script` (`a1`, `b2`, `c3`) VALUES (%s, %s, %s), (%s, %s, %s), ...;'
+        rowcount = database.bulk_load('tmp_test_script', ('a1', 'b2', 'c3'), rows, workers=4)
+        与 insert_bulk 相同的分块方式，由线程池中的 workers 个线程各自占用一个连接池连接并行写入，
+        生产者通过有界队列实现背压，单块写入失败时重新获取连接并重试 retries 次，返回各块影响行数之和
+        """
+        if self._session is not None and self._session.transaction:
+            raise RuntimeError('bulk_load 使用多个连接并行写入，不能在事务中调用，请使用 insert_bulk')
+        prefix, suffix, row_placeholder = self._insert_bulk_template(table, columns, ignore, update_columns, database)
+        if chunk_bytes is None:
+            chunk_bytes = self.max_allowed_packet() // 2
+        row_bytes = chunk_bytes - len((prefix + suffix).encode(self._encoding))
+
+        operations = {}
+        chunks = Queue(maxsize=workers * 2)
+        rowcount = Counter()
+        errors = []
+
+        def consume():
+            connect = cursor = None
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if errors:
+                    # 已有分块写入失败，仅消费队列以解除生产者阻塞
+                    continue
+                try:
+                    operation = operations.get(len(chunk))
+                    if operation is None:
+                        operation = operations.setdefault(
+                            len(chunk), prefix + ', '.join([row_placeholder] * len(chunk)) + suffix)
+                    params = [value for row in chunk for value in row]
+                    for attempt in range(retries + 1):
+                        try:
+                            if connect is None:
+                                connect = self._connection()
+                                cursor = connect.cursor()
+                            chunk_start = time.perf_counter()
+                            cursor.execute(operation, params)
+                            connect.commit()
+                            if self._metrics is not None:
+                                self._metrics.observe(('bulk_load', table), time.perf_counter() - chunk_start)
+                            rowcount.increase(cursor.rowcount)
+                            break
+                        except Exception as e:
+                            if self._metrics is not None:
+                                self._metrics.error(('bulk_load', table))
+                            self._close_quietly(cursor, connect)
+                            connect = cursor = None
+                            if attempt >= retries:
+                                raise
+                            self._logger.warning('Bulk load retry %s/%s: %s', attempt + 1, retries, e, stacklevel=2)
+                            time.sleep(min(0.1 * 2 ** attempt, 5))
+                except Exception as e:
+                    # 任何异常均记录后继续消费队列，避免生产者在有界队列上永久阻塞
+                    self._logger.exception('Bulk load error: %s', e, stacklevel=2)
+                    errors.append(e)
+            self._close_quietly(cursor, connect)
+
+        total, start = 0, time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='BulkLoad') as executor:
+                futures = [executor.submit(consume) for _ in range(workers)]
+                try:
+                    for chunk in self._chunk(rows, chunk_rows, row_bytes, self._encoding):
+                        if errors:
+                            break
+                        chunks.put(chunk)
+                        total += len(chunk)
+                finally:
+                    for _ in range(workers):
+                        chunks.put(None)
+            for future in futures:
+                # 写入线程自身异常退出时抛出，不被静默忽略
+                future.result()
+        finally:
+            self.invalidate_cache(table)
+            self._adjust_count(table, database, None if update_columns else rowcount.variable)
+        if errors:
+            raise errors[0]
+        elapsed = time.perf_counter() - start
+        self._logger.info(
+            'Bulk load finished: %s rows in %.3f sec with %s workers, %.0f rows/sec',
+            total, elapsed, workers, total / elapsed if elapsed else 0, stacklevel=3)
+        return rowcount.variable
+
+    def _insert_bulk_template(
+            self, table: str, columns: tuple, ignore: bool, update_columns: Optional[tuple], database: Optional[str]
+    ) -> Tuple[str, str, str]:
+        """多行 INSERT 语句的模板函数，返回语句前缀、语句后缀及单行占位符"""
+        prefix = 'INSERT {ignore}INTO {database}{table} ({columns}) VALUES '.format(
+            ignore='IGNORE ' if ignore else '',
             database='{}.'.format(self._wrapper(database)) if database else '',
             table=self._wrapper(table),
-            columns=self._placeholder_plus(columns),
-            params=self._placeholder(columns)
+            columns=self._placeholder_plus(columns)
         )
-        with self.executemany(operation, seq_params=seq_params, stacklevel=5) as cur:
-            rowcount = cur.rowcount
-        return rowcount
+        suffix = ' ON DUPLICATE KEY UPDATE {};'.format(
+            ', '.join('`{0}` = VALUES(`{0}`)'.format(column) for column in update_columns)
+        ) if update_columns else ';'
+        return prefix, suffix, '({})'.format(self._placeholder(columns))
+
+    @staticmethod
+    def _close_quietly(cursor, connect) -> None:
+        for closeable in (cursor, connect):
+            if closeable is not None:
+                with contextlib.suppress(Exception):
+                    closeable.close()
+
+    @staticmethod
+    def _chunk(
+            rows: Iterable[tuple], chunk_rows: int, chunk_bytes: int, encoding: str = 'utf-8'
+    ) -> Iterator[List[tuple]]:
+        """
+        分块函数（按行数及估算字节数切分，单行超过字节数限制时独占一块），
+        字符串按连接字符集编码后的字节数估算，包含需要转义的字符时按两倍估算
+        """
+        chunk, size = [], 0
+        for row in rows:
+            row_size = 4 * len(row)
+            for value in row:
+                if isinstance(value, str):
+                    length = len(value.encode(encoding, 'replace'))
+                    row_size += length * 2 if _ESCAPED.search(value) else length
+                elif isinstance(value, (bytes, bytearray)):
+                    row_size += len(value) * 2 if _ESCAPED_BYTES.search(value) else len(value)
+                else:
+                    row_size += len(str(value))
+            if chunk and (len(chunk) >= chunk_rows or size + row_size > chunk_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(row)
+            size += row_size
+        if chunk:
+            yield chunk
+
+    def max_allowed_packet(self) -> int:
+        """
+        sql = 'SELECT @@max_allowed_packet;'
+        size = database.max_allowed_packet()
+        """
+        if self._max_allowed_packet is None:
+            with self.execute('SELECT @@max_allowed_packet;', stacklevel=5) as cur:
+                self._max_allowed_packet, = cur.fetchone()
+        return self._max_allowed_packet
 
     def delete(self, table: str, columns: tuple, params: tuple, database: str = None) -> int:
         """
         sql = 'DELETE FROM `tmp_test_script` WHERE `a1`=%s AND `b2`=%s AND `c3`=%s;'
         rowcount = database.delete('tmp_test_script', ('a1', 'b2', 'c3'), ("4", "5", "6"))
         """
-        operator = 'DELETE FROM {database}{table} WHERE {columns};'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            columns=self._placeholder_plus(columns, sy='`%s` = %%s', sp=' AND ')
-        )
-        with self.execute(operator, params=params, stacklevel=5) as cur:
+        operator = self._statement('delete', table, tuple(columns), database)
+        with self.execute(operator, params=params, metric=('delete', table), stacklevel=5) as cur:
             rowcount = cur.rowcount
+        self.invalidate_cache(table)
+        self._adjust_count(table, database, -rowcount)
         return rowcount
 
     def select_one(self, table: str, columns: tuple = (), database: str = None) -> iter:
@@ -268,49 +1031,133 @@ class MySQLDatabase:
         sql = 'SELECT `a1`, `b2`, `c3` FROM `tmp_test_script`;'
         database.select_one('tmp_test_script', ('a1', 'b2', 'c3')) <-- loop it
         """
-        operation = 'SELECT {columns} FROM {database}{table};'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            columns=self._placeholder_plus(columns) if columns else '*'
-        )
-        with self.execute(operation, stacklevel=5) as cur:
+        operation = self._statement('select', table, tuple(columns), database)
+        with self.execute(operation, metric=('select_one', table), stacklevel=5) as cur:
             while True:
                 row = cur.fetchone()
                 if not row:
                     break
                 yield row
 
-    def select_many(self, table: str, columns: tuple = (), size: int = None, database: str = None) -> iter:
+    def select_many(
+            self, table: str, columns: tuple = (), size: int = None, database: str = None,
+            *, as_columns: bool = False, numpy: bool = False
+    ) -> iter:
         """
         sql = 'SELECT `a1`, `b2`, `c3` FROM `tmp_test_script`;'
         database.select_many('tmp_test_script', ('a1', 'b2', 'c3'), size=2) <-- loop it
+        as_columns 为 True 时每批结果按列返回 {列名: 列数据}，参考 select_all
         """
-        operation = 'SELECT {columns} FROM {database}{table};'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            columns=self._placeholder_plus(columns) if columns else '*'
-        )
-        with self.execute(operation, stacklevel=5) as cur:
-            while True:
-                rows = cur.fetchmany(size)
-                if not rows:
-                    break
-                yield rows
+        operation = self._statement('select', table, tuple(columns), database)
+        with self.execute(operation, metric=('select_many', table), stacklevel=5) as cur:
+            for rows in self._fetch_batches(cur, size):
+                yield self._columnar(cur.description, (rows,), numpy) if as_columns else rows
 
-    def select_all(self, table: str, columns: tuple = (), database: str = None) -> list:
+    def select_all(
+            self, table: str, columns: tuple = (), database: str = None,
+            *, as_columns: bool = False, numpy: bool = False
+    ) -> Union[list, dict]:
         """
         sql = 'SELECT `a1`, `b2`, `c3` FROM `tmp_test_script`;'
         rows = database.select_all('tmp_test_script', ('a1', 'b2', 'c3'))
+        as_columns 为 True 时按列返回 {列名: 列数据}，整数及浮点数列使用 array.array 存储，
+        包含 NULL 或超出范围的列及其他类型的列使用列表存储，numpy 为 True 时转换为 NumPy 数组
         """
-        operation = 'SELECT {columns} FROM {database}{table};'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            columns=self._placeholder_plus(columns) if columns else '*'
-        )
-        with self.execute(operation, stacklevel=5) as cur:
-            rows = cur.fetchall()
+        operation = self._statement('select', table, tuple(columns), database)
+        if self._cache is not None:
+            key = (operation, None, as_columns, numpy)
+            hit, rows = self._cache.get(key)
+            if hit:
+                return rows
+            generation = self._cache.generation(table)
+        with self.execute(operation, metric=('select_all', table), stacklevel=5) as cur:
+            if as_columns:
+                rows = self._columnar(cur.description, self._fetch_batches(cur, 10000), numpy)
+            else:
+                rows = cur.fetchall()
+        if self._cache is not None:
+            self._cache.put(table, key, rows, generation)
         return rows
 
+    @staticmethod
+    def _fetch_batches(cursor, size: Optional[int]) -> Iterator[list]:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            yield rows
+
+    # MySQL 字段类型编号（MySQLdb 与 mysql.connector 一致）对应的 array.array 类型代码
+    # TINY、SHORT、LONG、LONGLONG、INT24、YEAR -> 有符号 64 位整数；FLOAT、DOUBLE -> 双精度浮点数
+    _column_typecodes = {1: 'q', 2: 'q', 3: 'q', 8: 'q', 9: 'q', 13: 'q', 4: 'd', 5: 'd'}
+
+    def _columnar(self, description: tuple, batches: Iterable[list], numpy: bool = False) -> dict:
+        """按列组装结果集，逐批追加后即丢弃行对象，避免同时持有全部行"""
+        names = [field[0] for field in description]
+        columns = [array(self._column_typecodes[field[1]]) if field[1] in self._column_typecodes else []
+                   for field in description]
+        for rows in batches:
+            if isinstance(rows[0], dict):
+                rows = [tuple(row[name] for name in names) for row in rows]
+            for index, values in enumerate(zip(*rows)):
+                column = columns[index]
+                length = len(column)
+                try:
+                    column.extend(values)
+                except (TypeError, OverflowError):
+                    # 包含 NULL 或超出范围的数值时退化为列表
+                    columns[index] = column[:length].tolist() + list(values)
+        if numpy:
+            import numpy as np
+            columns = [np.asarray(column) if isinstance(column, array) else np.array(column, dtype=object)
+                       for column in columns]
+        return dict(zip(names, columns))
+
+    def scan(
+            self, table: str, columns: tuple = (), key: str = 'id', batch: int = 10000, start=None,
+            prefetch: bool = False, database: str = None
+    ) -> iter:
+        """
+        sql = 'SELECT `a1`, `id` FROM `tmp_test_script` WHERE `id` > %s ORDER BY `id` LIMIT %s;'
+        database.scan('tmp_test_script', ('a1',), key='id', batch=2, start=checkpoint) <-- loop it
+        按主键分页扫描全表，每页单独获取及释放连接，start 为上次扫描的最后一个主键值（不包含），
+        key 必须为主键或唯一键，否则分页边界上与上一页最后一行取值相同的行会被跳过；
+        columns 不包含 key 时在每行末尾追加 key 列，调用方可记录已处理的最后一个 key 作为下次扫描的 start；
+        prefetch 为 True 时在后台线程中预取下一页（会话中共享游标，不预取）
+        """
+        prefetch = prefetch and self._session is None
+        columns = tuple(columns)
+        select_columns = columns + (key,) if columns and key not in columns else columns
+
+        def fetch(last):
+            if last is None:
+                operation = self._statement('scan_first', table, select_columns, database, (key,))
+                params = (batch,)
+            else:
+                operation = self._statement('scan', table, select_columns, database, (key,))
+                params = (last, batch)
+            with self.execute(operation, params=params, metric=('scan', table), stacklevel=5) as cur:
+                rows = cur.fetchall()
+                names = [description[0] for description in cur.description or ()]
+            return rows, names
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ScanPrefetch') if prefetch else None
+        try:
+            rows, names = fetch(start)
+            while rows:
+                future = last = None
+                if len(rows) >= batch:
+                    last = rows[-1][key] if isinstance(rows[-1], dict) else rows[-1][names.index(key)]
+                    if executor is not None:
+                        future = executor.submit(fetch, last)
+                yield from rows
+                if last is None:
+                    break
+                rows, names = future.result() if future is not None else fetch(last)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
     def update(self, table: str, values: dict, columns: tuple, params: tuple, database: str = None) -> int:
         """
         sql = 'UPDATE `tmp_test_script` SET `a1`=%s, `b2`=%s, `c3`=%s WHERE `a1`=%s AND `b2`=%s AND `c3`=%s;'
@@ -318,29 +1165,210 @@ class MySQLDatabase:
                                    ('a1', 'b2', 'c3'), ("1", "2", "3"))
         """
         keys, values = zip(*values.items())
-        operator = 'UPDATE {database}{table} SET {values} WHERE {columns};'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            values=self._placeholder_plus(keys, sy='`%s` = %%s'),
-            columns=self._placeholder_plus(columns, sy='`%s` = %%s', sp=' AND ')
-        )
-        with self.execute(operator, params=values + params, stacklevel=5) as cur:
+        operator = self._statement('update', table, tuple(columns), database, keys)
+        with self.execute(operator, params=values + params, metric=('update', table), stacklevel=5) as cur:
             rowcount = cur.rowcount
+        self.invalidate_cache(table)
         return rowcount
 
-    def count(self, table: str, column: str = None, database: str = None) -> int:
+    def count(self, table: str, column: str = None, database: str = None, approximate: bool = False) -> int:
         """
         sql = 'SELECT COUNT(`a1`) FROM `tmp_test_script`;'
         rowcount = database.count('tmp_test_script', 'a1')
+        approximate 为 True 时忽略 column 并返回 ApproximateCount：通过 track_count 跟踪的表返回增量维护的行数，
+        其余表读取 information_schema.TABLES.TABLE_ROWS（InnoDB 下为采样估算值，误差可达 40% 以上）
         """
-        operation = 'SELECT COUNT({column}) FROM {database}{table};'.format(
-            database='{}.'.format(self._wrapper(database)) if database else '',
-            table=self._wrapper(table),
-            column=self._wrapper(column) if column else '*'
-        )
-        with self.execute(operation, stacklevel=5) as cur:
+        if approximate:
+            return self._approximate_count(table, database)
+        operation = self._statement('count', table, (column,) if column else (), database)
+        if self._cache is not None:
+            key = (operation, None)
+            hit, row = self._cache.get(key)
+            if hit:
+                return row
+            generation = self._cache.generation(table)
+        with self.execute(operation, metric=('count', table), stacklevel=5) as cur:
             row, = cur.fetchone()
+        if self._cache is not None:
+            self._cache.put(table, key, row, generation)
         return row
 
+    def track_count(self, table: str, database: str = None) -> ApproximateCount:
+        """
+        sql = 'SELECT COUNT(*) FROM `tmp_test_script`;'
+        rowcount = database.track_count('tmp_test_script')
+        精确计数一次后，根据通过本对象执行的 insert_*、delete 的影响行数增量维护该表的行数，
+        使用 ON DUPLICATE KEY UPDATE 写入后无法区分插入与更新，将在下次查询时重新精确计数，
+        staleness 为距离上次精确计数的秒数，即其他客户端的写入可能未被计入的时间范围
+        """
+        self._tracked_counts.add((database, table))
+        self._reset_count((database, table))
+        return self._approximate_count(table, database)
+
+    def _reset_count(self, key: tuple) -> None:
+        """丢弃增量维护的行数，下次查询时重新精确计数，正在进行的精确计数结果也不再采用"""
+        with self._count_mutex:
+            self._row_counters.pop(key, None)
+            if key in self._pending_counts:
+                self._pending_counts[key] = None
+
+    def _adjust_count(self, table: str, database: Optional[str], delta: Optional[int]) -> None:
+        """增量维护行数（delta 为 None 表示无法确定变化量，下次查询时重新精确计数）"""
+        key = (database, table)
+        if key not in self._tracked_counts:
+            return
+        if delta is None:
+            self._reset_count(key)
+            return
+        with self._count_mutex:
+            entry = self._row_counters.get(key)
+            if entry is not None:
+                entry[0].increase(delta)
+            elif self._pending_counts.get(key) is not None:
+                self._pending_counts[key] += delta
+
+    def _approximate_count(self, table: str, database: Optional[str]) -> ApproximateCount:
+        key = (database, table)
+        if key in self._tracked_counts:
+            with self._count_mutex:
+                entry = self._row_counters.get(key)
+                if entry is None:
+                    # 精确计数期间的写入先累加到待计入的增量中，计数完成后计入初始行数
+                    self._pending_counts.setdefault(key, 0)
+            if entry is None:
+                seeded = time.monotonic()
+                operation = self._statement('count', table, (), database)
+                with self.execute(operation, metric=('count', table), stacklevel=6) as cur:
+                    row, = cur.fetchone()
+                with self._count_mutex:
+                    entry = self._row_counters.get(key)
+                    if entry is None:
+                        delta = self._pending_counts.pop(key, None)
+                        if delta is None:
+                            # 计数期间出现无法确定变化量的写入，本次结果不作为初始行数，下次查询时重新计数
+                            return ApproximateCount(row, 0, 'counter')
+                        entry = self._row_counters[key] = (Counter(row + delta), seeded)
+            return ApproximateCount(entry[0].variable, time.monotonic() - entry[1], 'counter')
+
+        operation = ('SELECT `TABLE_ROWS` FROM `information_schema`.`TABLES` '
+                     'WHERE `TABLE_SCHEMA` = COALESCE(%s, DATABASE()) AND `TABLE_NAME` = %s;')
+        with self.execute(operation, params=(database, table), metric=('count', table), stacklevel=6) as cur:
+            row = cur.fetchone()
+        if row is None:
+            raise ValueError('数据表不存在：{}'.format(table))
+        rows = row['TABLE_ROWS'] if isinstance(row, dict) else row[0]
+        return ApproximateCount(rows or 0, self.stats_expiry(), 'information_schema')
+
+    def stats_expiry(self) -> int:
+        """
+        sql = "SHOW VARIABLES LIKE 'information_schema_stats_expiry';"
+        seconds = database.stats_expiry()
+        information_schema 表统计信息的缓存秒数（MySQL 8.0 起默认为 86400），
+        不支持该变量的版本（MySQL 5.7、MariaDB）查询结果为空，返回 0，表示统计信息的滞后时间没有上限，而非实时
+        """
+        if self._stats_expiry is None:
+            with self.execute("SHOW VARIABLES LIKE 'information_schema_stats_expiry';", stacklevel=5) as cur:
+                row = cur.fetchone()
+            if row is None:
+                self._stats_expiry = 0
+            else:
+                self._stats_expiry = int(row['Value'] if isinstance(row, dict) else row[1])
+        return self._stats_expiry
+
+
+class AsyncMySQLDatabase:
+    def __init__(self, creator: object, *, max_workers: int = None, **kwargs) -> None:
+        """
+        异步数据库操作类 AsyncMySQLDatabase 的初始化参数与 MySQLDatabase 一致，
+        以协程及异步生成器的形式提供相同的增删改查方法，查询在有界线程池中基于 MySQLDatabase 的连接池执行
+        :param int max_workers:
+            执行查询的线程池大小，默认值为 max_connections 与 max_cached 中不为 0 的较小值（未指定时取 MySQLDatabase 的默认值），
+            两者均为 0（不限制）时使用 ThreadPoolExecutor 的默认线程数
+            注：线程数超过 max_cached 时，归还的连接会因空闲连接缓存已满被关闭，下次查询需重新建立连接
+        """
+        self._database = MySQLDatabase(creator, **kwargs)
+        if max_workers is None:
+            # 未指定的连接池参数取 MySQLDatabase 的默认值，避免两处默认值不一致
+            parameters = inspect.signature(MySQLDatabase).parameters
+            sizes = [size for size in (kwargs.get(name, parameters[name].default)
+                                        for name in ('max_connections', 'max_cached')) if size]
+            max_workers = min(sizes) if sizes else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncMySQL')
+
+    @property
+    def database(self) -> MySQLDatabase:
+        return self._database
+
+    async def _run(self, function: callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args, **kwargs))
+
+    async def _iterate(self, generator: Iterator, flatten: bool = False) -> AsyncIterator:
+        """在线程池中逐步推进同步生成器，flatten 为真时逐条展开每批结果，生成器结束或被中断时在线程池中关闭以释放连接"""
+        loop, sentinel = asyncio.get_running_loop(), object()
+        try:
+            while True:
+                item = await loop.run_in_executor(self._executor, next, generator, sentinel)
+                if item is sentinel:
+                    break
+                if not flatten:
+                    yield item
+                    continue
+                for row in item:
+                    yield row
+        finally:
+            await loop.run_in_executor(self._executor, generator.close)
+
+    async def create_table(self, *args, **kwargs) -> int:
+        return await self._run(self._database.create_table, *args, **kwargs)
+
+    async def drop_table(self, *args, **kwargs) -> int:
+        return await self._run(self._database.drop_table, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs) -> int:
+        return await self._run(self._database.insert_one, *args, **kwargs)
+
+    async def insert_all(self, *args, **kwargs) -> int:
+        return await self._run(self._database.insert_all, *args, **kwargs)
+
+    async def insert_bulk(self, *args, **kwargs) -> int:
+        return await self._run(self._database.insert_bulk, *args, **kwargs)
+
+    async def bulk_load(self, *args, **kwargs) -> int:
+        return await self._run(self._database.bulk_load, *args, **kwargs)
+
+    async def delete(self, *args, **kwargs) -> int:
+        return await self._run(self._database.delete, *args, **kwargs)
+
+    def select_one(self, table: str, columns: tuple = (), database: str = None, size: int = 1000) -> AsyncIterator:
+        """逐条返回查询结果，内部按 size 分批获取以减少线程切换"""
+        return self._iterate(self._database.select_many(table, columns, size, database), flatten=True)
+
+    def select_many(self, *args, **kwargs) -> AsyncIterator:
+        return self._iterate(self._database.select_many(*args, **kwargs))
+
+    async def select_all(self, *args, **kwargs) -> Union[list, dict]:
+        return await self._run(self._database.select_all, *args, **kwargs)
+
+    def scan(self, *args, **kwargs) -> AsyncIterator:
+        return self._iterate(self._database.scan(*args, **kwargs))
+
+    async def update(self, *args, **kwargs) -> int:
+        return await self._run(self._database.update, *args, **kwargs)
+
+    async def count(self, *args, **kwargs) -> int:
+        return await self._run(self._database.count, *args, **kwargs)
+
+    async def max_allowed_packet(self) -> int:
+        return await self._run(self._database.max_allowed_packet)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> 'AsyncMySQLDatabase':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
 
-__all__ = ['MySQLDatabase']
+__all__ = ['ResultCache', 'ApproximateCount', 'PoolMetrics', 'MySQLDatabase', 'AsyncMySQLDatabase']
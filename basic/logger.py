@@ -9,19 +9,32 @@
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.2
+@Version     : 1.3
 """
+import atexit
+import copy
+import json
 import logging
 import os
+import random
+import re
+import shutil
 import sys
 import time
 import traceback
-from functools import wraps, partial
+from collections import OrderedDict
+from functools import lru_cache, wraps, partial
 from inspect import isfunction
 from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL, WARN, FATAL
 from logging.handlers import RotatingFileHandler
-from typing import Union, Optional
-
+from multiprocessing import Event, Process, current_process
+from multiprocessing.connection import Client, Listener, arbitrary_address, default_family, wait
+from queue import Queue
+from threading import Lock, Thread
+from typing import Iterator, List, Union, Optional
+
+from basic.counter import Counter
+from basic.metrics import MetricsReporter
 from basic.variable import GlobalSyncVariable
 
 if sys.version_info < (3, 8):
@@ -96,14 +109,32 @@ class TintFormatter(logging.Formatter):
         'CRITICAL': ('FATAL', {'fg': 'red', 'bold': True}),
     }
 
+    _field_style = {
+        'datetime': {'fg': 'white'},
+        'pid': {'fg': 'bright_magenta'},
+        'thread_name': {'fg': 'white', 'bold': True},
+        'full_path': {'fg': 'cyan'},
+    }
+
     def __init__(self, colour: bool = False, simplify: bool = False, simplify_path: bool = False):
         if simplify:
             super().__init__('%(datetime)s %(level)s | %(content)s')
         else:
             super().__init__('%(datetime)s %(level)s %(pid)s --- [%(thread_name)s] %(full_path)s | %(content)s')
-        self._tint = lambda text, *args, **kwargs: self._colour(text, *args, **kwargs) if colour else text
         self._simplify = simplify
         self._simplify_path = simplify_path
+        self._datetime_cache = (None, '')
+
+        # 预先为每个日志等级生成已嵌入着色转义序列的模板，格式化时仅需一次模板替换
+        self._templates = {}
+        for levelname, (level, color) in self._tint_style.items():
+            template = self._fmt
+            if colour:
+                for field, style in dict(self._field_style, level=color, content=color).items():
+                    placeholder = '%({})s'.format(field)
+                    template = template.replace(placeholder, self._colour(placeholder, **style))
+            self._templates[levelname] = ('{: >5}'.format(level), template)
+        self._exc_template = self._colour('%s', fg='red') if colour else '%s'
 
         class ThreadNameLength(GlobalSyncVariable):
             def __init__(self):
@@ -113,71 +144,67 @@ class TintFormatter(logging.Formatter):
             def __init__(self):
                 super().__init__(0)
 
-        class FullPathMapper(GlobalSyncVariable):
-            def __init__(self):
-                super().__init__({})
-
         self._thread_name_length = ThreadNameLength().variable
         self._full_path_length = FullPathLength().variable
-        self._full_path_mapper = FullPathMapper().variable
 
     def format(self, record):
-        level, color = self._tint_style.get(record.levelname)
+        record.level, template = self._templates[record.levelname]
 
-        datetime = '{localtime}.{localtime_msecs:03.0f}'.format(
-            localtime=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
-            localtime_msecs=999 if record.msecs > 999 else record.msecs
-        )
-        level = '{level: >5}'.format(level=level)
-        content = record.getMessage()
-
-        record.datetime = self._tint(datetime, fg='white')
-        record.level = self._tint(level, **color)
-        record.content = self._tint(content, **color)
+        # 按秒缓存日期时间前缀，每条日志仅拼接毫秒部分
+        created = int(record.created)
+        datetime_key, datetime_prefix = self._datetime_cache
+        if datetime_key != created:
+            datetime_prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+            self._datetime_cache = (created, datetime_prefix)
+        record.datetime = '{}.{:03d}'.format(datetime_prefix, int(record.msecs))
+        record.content = record.getMessage()
 
         if self._simplify is False:
-            pid = '{process: >5}'.format(process=record.process)
-            thread_name = '{thread_name: ^{length:1}}'.format(
+            record.pid = '{process: >5}'.format(process=record.process)
+            record.thread_name = thread_name = '{thread_name: ^{length:1}}'.format(
                 thread_name=record.threadName,
                 length=self._thread_name_length
             )
-            full_path = self._format_path(record.pathname, record.lineno)
-
-            record.pid = self._tint(pid, fg='bright_magenta')
-            record.thread_name = self._tint(thread_name, fg='white', bold=True)
-            record.full_path = self._tint(full_path, fg='cyan')
+            record.full_path = full_path = self._format_path(record.pathname, record.lineno)
 
             if len(thread_name) > self._thread_name_length:
                 self._thread_name_length = len(thread_name)
             if len(full_path) > self._full_path_length:
-                self._full_path_mapper.clear()
                 self._full_path_length = len(full_path)
 
+        # 异步或多进程输出时日志记录已预先格式化异常信息，仅保留 exc_text
+        exc_text = record.exc_text
         if record.exc_info:
-            exc_info = self.formatException(record.exc_info)
-            record.exc_text = self._tint(exc_info, fg='red')
-
-        return super().format(record)
+            exc_text = self.formatException(record.exc_info)
+
+        text = template % record.__dict__
+        if exc_text:
+            text = '{}\n{}'.format(text, self._exc_template % exc_text)
+        if record.stack_info:
+            text = '{}\n{}'.format(text, self.formatStack(record.stack_info))
+        return text
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _shorten_path(pathname: str, simplify_path: bool) -> tuple:
+        """路径缩短函数，返回由长到短逐级缩短的候选路径，结果按路径缓存"""
+        path_array = os.path.abspath(pathname).split(os.path.sep)
+        if simplify_path:
+            return path_array[-1],
+        candidates = [os.path.sep.join(path_array)]
+        for i in range(1, len(path_array) - 1):
+            if len(path_array[i]) > 1 and not path_array[i].endswith('..'):
+                path_array[i] = '{}..'.format(path_array[i][:1])
+                candidates.append(os.path.sep.join(path_array))
+        return tuple(candidates)
 
     def _format_path(self, pathname: str, lineno: int):
         """路径格式化函数（自动缩短）"""
-        key = (pathname, lineno)
-        if key not in self._full_path_mapper.keys():
-            path_array = os.path.abspath(pathname).split(os.path.sep)
-            path_array[-1] += ':{}'.format(lineno)
-            if self._simplify_path:
-                path_array = path_array[-1:]
-            else:
-                while len(os.path.sep.join(path_array)) > self._full_path_length:
-                    for i in range(1, len(path_array) - 1):
-                        if len(path_array[i]) > 1 and not path_array[i].endswith('..'):
-                            path_array[i] = '{}..'.format(path_array[i][:1])
-                            break
-                    else:
-                        break
-            full_path = '{0: <{1}}'.format(os.path.sep.join(path_array), self._full_path_length)
-            self._full_path_mapper[key] = full_path
-        return self._full_path_mapper[key]
+        suffix = ':{}'.format(lineno)
+        for path in self._shorten_path(pathname, self._simplify_path):
+            if len(path) + len(suffix) <= self._full_path_length:
+                break
+        return '{0: <{1}}'.format(path + suffix, self._full_path_length)
 
     def _colour(self, text,
                 *, fg=None, bg=None, bold=None, dim=None, underline=None, blink=None, reverse=None, reset=True):
@@ -203,108 +230,678 @@ class TintFormatter(logging.Formatter):
         return ''.join(bits)
 
 
+class StructFormatter(logging.Formatter):
+    """
+    结构化日志格式化类，每行一条记录，日志器名称、路径及线程名称以字符串表的方式去重存储
+      - 字符串定义：S <编号> <JSON 字符串>
+      - 日志记录：R <等级> <时间戳> <JSON 数组：[日志器名称编号, 路径编号, 行号, 线程名称编号, 进程号, 内容, 异常]>
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._strings = {}
+
+    def reset(self) -> None:
+        """重置字符串表，写入新文件时需重新输出字符串定义"""
+        self._strings = {}
+
+    def _intern(self, text: str, lines: list) -> int:
+        index = self._strings.get(text)
+        if index is None:
+            index = self._strings[text] = len(self._strings)
+            lines.append('S {} {}'.format(index, json.dumps(text, ensure_ascii=False)))
+        return index
+
+    def format(self, record):
+        lines = []
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = self.formatException(record.exc_info)
+        fields = [
+            self._intern(record.name, lines), self._intern(record.pathname, lines), record.lineno,
+            self._intern(record.threadName, lines), record.process, record.getMessage(), exc_text,
+        ]
+        lines.append('R {} {:.6f} {}'.format(record.levelno, record.created, json.dumps(fields, ensure_ascii=False)))
+        return '\n'.join(lines)
+
+
+class StructFileHandler(RotatingFileHandler):
+    """结构化日志文件处理器，文件轮转后重置字符串表"""
+
+    def shouldRollover(self, record) -> bool:
+        # 字符串表依赖写入顺序，此处仅按当前文件大小判断，避免提前格式化日志记录
+        if self.stream is None:
+            self.stream = self._open()
+        return 0 < self.maxBytes <= self.stream.tell()
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        if isinstance(self.formatter, StructFormatter):
+            self.formatter.reset()
+
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """
+    按大小及时间轮转的文件日志处理器，轮转时仅将当前文件重命名为带时间戳的分段文件，
+    分段文件的压缩及按数量、磁盘预算的清理均由后台线程完成，不阻塞日志调用线程
+    """
+    _segment_pattern = re.compile(r'^\.(\d{8}_\d{6})(?:_(\d+))?(?:\.gz|\.zst)?$')
+
+    def __init__(
+            self, filename: str, mode: str = 'a', max_bytes: int = 0, interval: float = 0, backup_count: int = 0,
+            disk_budget: int = 0, compression: Optional[str] = COMPRESSION_GZIP, encoding: str = None,
+            delay: bool = False
+    ):
+        """
+        :param int max_bytes: 单个日志文件的最大字节数，为 0 表示不按大小轮转
+        :param float interval: 日志文件的轮转间隔秒数，为 0 表示不按时间轮转
+        :param int backup_count: 保留的分段文件最大数量，为 0 表示不限制
+        :param int disk_budget: 分段文件的最大总字节数，超过时由旧到新删除，为 0 表示不限制
+        :param str|None compression: 分段文件的压缩格式，支持 gzip、zstd（需安装 zstandard），为 None 表示不压缩
+        """
+        if compression not in (None, COMPRESSION_GZIP, COMPRESSION_ZSTD):
+            raise ValueError('暂不支持的压缩格式')
+        super().__init__(filename, mode, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=delay)
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+        self.disk_budget = disk_budget
+        self.compression = compression
+        self._segment_last = (None, 0)
+        self._queue = Queue()
+        self._thread = Thread(target=self._monitor, name='LogCompressor', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def shouldRollover(self, record) -> bool:
+        if 0 < self.interval and self.rollover_at <= record.created:
+            return True
+        # 仅按当前文件大小判断，避免提前格式化日志记录
+        if self.stream is None:
+            self.stream = self._open()
+        return 0 < self.maxBytes <= self.stream.tell()
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            # 同一秒内多次轮转时追加递增序号，保证分段文件按名称排序即为时间顺序
+            stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime())
+            number = self._segment_last[1] + 1 if self._segment_last[0] == stamp else 0
+            segment = '{}.{}'.format(self.baseFilename, stamp)
+            name = '{}_{}'.format(segment, number) if number else segment
+            while os.path.exists(name) or any(os.path.exists(name + ext) for ext in ('.gz', '.zst')):
+                number += 1
+                name = '{}_{}'.format(segment, number)
+            self._segment_last = (stamp, number)
+            os.replace(self.baseFilename, name)
+            self._queue.put(name)
+        if not self.delay:
+            self.stream = self._open()
+        self.rollover_at = time.time() + self.interval
+        if isinstance(self.formatter, StructFormatter):
+            self.formatter.reset()
+
+    def _monitor(self) -> None:
+        while True:
+            segment = self._queue.get()
+            if segment is None:
+                break
+            try:
+                self._compress(segment)
+                self._retain()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def _compress(self, segment: str) -> None:
+        if self.compression == COMPRESSION_GZIP:
+            import gzip
+            opener, ext = gzip.open, '.gz'
+        elif self.compression == COMPRESSION_ZSTD:
+            import zstandard
+            opener, ext = zstandard.open, '.zst'
+        else:
+            return
+        if not os.path.exists(segment):
+            # 压缩前已被清理
+            return
+        with open(segment, 'rb') as src, opener(segment + ext, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(segment)
+
+    def _retain(self) -> None:
+        """按保留数量及磁盘预算由旧到新删除分段文件"""
+        dirname, basename = os.path.split(self.baseFilename)
+        matches = []
+        for name in os.listdir(dirname):
+            match = self._segment_pattern.match(name[len(basename):]) if name.startswith(basename) else None
+            if match:
+                matches.append(((match.group(1), int(match.group(2) or 0)), os.path.join(dirname, name)))
+        segments = [segment for _, segment in sorted(matches)]
+        sizes = [os.path.getsize(segment) for segment in segments]
+        total = sum(sizes)
+        for index, segment in enumerate(segments):
+            if (0 < self.backupCount < len(segments) - index) or (0 < self.disk_budget < total):
+                os.remove(segment)
+                total -= sizes[index]
+            else:
+                break
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        atexit.unregister(self.close)
+        super().close()
+
+
+def iter_struct_log(
+        filename: str, level: int = None, start: float = None, end: float = None, encoding: str = 'utf-8'
+) -> Iterator[logging.LogRecord]:
+    """
+    逐条读取结构化日志文件，仅对满足等级及时间范围 [start, end) 的记录解析 JSON 内容
+    for record in iter_struct_log('test.log', level=WARNING, start=time.time() - 3600):
+        print(record.levelname, record.getMessage())
+    """
+    strings = {}
+    with open(filename, encoding=encoding) as f:
+        for line in f:
+            kind, index, value = line.rstrip('\n').split(' ', 2)
+            if kind == 'S':
+                strings[int(index)] = json.loads(value)
+                continue
+            if level is not None and int(index) < level:
+                continue
+            created, value = value.split(' ', 1)
+            created = float(created)
+            if (start is not None and created < start) or (end is not None and created >= end):
+                continue
+            name, pathname, lineno, thread_name, process, msg, exc_text = json.loads(value)
+            pathname = strings[pathname]
+            yield logging.makeLogRecord({
+                'name': strings[name], 'levelno': int(index), 'levelname': logging.getLevelName(int(index)),
+                'pathname': pathname, 'filename': os.path.basename(pathname), 'lineno': lineno,
+                'threadName': strings[thread_name], 'process': process, 'msg': msg, 'exc_text': exc_text,
+                'created': created, 'msecs': (created - int(created)) * 1000,
+            })
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    日志限流过滤器，按（日志器名称, 等级, 调用位置）分别进行令牌桶限流，并对 DEBUG、INFO 日志按比例采样，
+    被抑制的日志数量由后台线程按汇总间隔以汇总日志的方式在原调用位置输出，
+    令牌桶按最近使用顺序保留至多 max_keys 个，已回满的空闲令牌桶在汇总时清理
+    """
+
+    def __init__(
+            self, rate: float = 0, burst: int = 10, sample_rate: float = 1.0, summary_interval: float = 10.0,
+            max_keys: int = 10000
+    ):
+        super().__init__()
+        self._rate = rate
+        self._burst = burst
+        self._sample_rate = sample_rate
+        self._summary_interval = summary_interval
+        self._max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._suppressed = {}
+        self._mutex = Lock()
+        self._thread = None
+
+    def filter(self, record) -> bool:
+        if hasattr(record, 'suppressed_count'):
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._mutex:
+            allowed = self._allow(key, record.levelno, now)
+            if not allowed:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                if self._thread is None:
+                    # 首次抑制日志时启动汇总线程，确保此后不再输出日志的调用位置也能输出汇总
+                    self._thread = Thread(target=self._monitor, name='LogRateLimitSummary', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        return allowed
+
+    def _allow(self, key: tuple, levelno: int, now: float) -> bool:
+        if self._sample_rate < 1 and levelno <= INFO and random.random() >= self._sample_rate:
+            return False
+        if self._rate <= 0:
+            return True
+        tokens, last = self._buckets.get(key, (self._burst, now))
+        tokens = min(self._burst, tokens + (now - last) * self._rate)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self._max_keys:
+            # 淘汰最久未使用的令牌桶，再次出现时按已回满处理
+            self._buckets.popitem(last=False)
+        return allowed
+
+    def _monitor(self) -> None:
+        while True:
+            time.sleep(self._summary_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """输出被抑制日志的汇总，并清理令牌已回满的空闲令牌桶"""
+        now = time.monotonic()
+        with self._mutex:
+            summaries, self._suppressed = self._suppressed, {}
+            if self._rate > 0:
+                # 令牌桶按最近使用顺序排列，空闲时间足以回满令牌的令牌桶与新建的等价
+                refill = self._burst / self._rate
+                while self._buckets and now - next(iter(self._buckets.values()))[1] >= refill:
+                    self._buckets.popitem(last=False)
+        if summaries:
+            self._emit_summaries(summaries)
+
+    @staticmethod
+    def _emit_summaries(summaries: dict) -> None:
+        for (name, levelno, pathname, lineno), count in summaries.items():
+            logger = logging.getLogger(name)
+            record = logger.makeRecord(
+                name, levelno, pathname, lineno, 'Suppressed %s similar messages', ('{:,}'.format(count),), None)
+            record.suppressed_count = count
+            logger.handle(record)
+
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_DEBUG = 'drop_debug'
+
+
+class LogQueue(Queue):
+    """
+    有界日志队列，队列已满时按溢出策略处理新入队的日志记录
+      - block：阻塞等待队列空闲
+      - drop_oldest：丢弃队列中最早的日志记录
+      - drop_debug：优先丢弃 DEBUG 日志记录，队列中不存在 DEBUG 日志记录时阻塞等待
+    """
+
+    def __init__(self, maxsize: int = 10000, overflow: str = OVERFLOW_BLOCK):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_DEBUG):
+            raise ValueError('暂不支持的溢出策略')
+        super().__init__(maxsize)
+        self._overflow = overflow
+        self.dropped = Counter()
+
+    def put(self, item, block=True, timeout=None) -> None:
+        if self._overflow == OVERFLOW_BLOCK or item is None or self.maxsize <= 0:
+            # 关闭标记 None 不受溢出策略影响，阻塞等待入队
+            return super().put(item, block, timeout)
+        with self.not_full:
+            while self._qsize() >= self.maxsize:
+                if self._overflow == OVERFLOW_DROP_OLDEST and self.queue[0] is not None:
+                    self.queue.popleft()
+                elif self._overflow == OVERFLOW_DROP_OLDEST or item.levelno <= DEBUG:
+                    # 队首为关闭标记（不可丢弃，其后的日志记录不会再被处理）或新入队的为 DEBUG 日志记录时直接丢弃
+                    self.dropped.increase()
+                    return
+                elif not self._drop_debug():
+                    self.not_full.wait()
+                    continue
+                # 被丢弃的日志记录视为已完成
+                self.unfinished_tasks -= 1
+                self.dropped.increase()
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _drop_debug(self) -> bool:
+        for index, record in enumerate(self.queue):
+            if record is not None and record.levelno <= DEBUG:
+                del self.queue[index]
+                return True
+        return False
+
+
+def _prepare_record(record: logging.LogRecord) -> logging.LogRecord:
+    """复制日志记录，合并日志内容及参数并格式化异常信息，与 QueueHandler.prepare 一致"""
+    record = copy.copy(record)
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+    record.exc_info = None
+    return record
+
+
+class AsyncHandler(logging.Handler):
+    """异步日志处理器，调用线程仅将日志记录放入有界队列，由单个后台线程分发至实际的日志处理器"""
+
+    def __init__(self, handlers: List[logging.Handler], queue_size: int = 10000, overflow: str = OVERFLOW_BLOCK):
+        super().__init__()
+        self.handlers = handlers
+        self._queue = LogQueue(queue_size, overflow)
+        self._thread = Thread(target=self._monitor, name='AsyncLogWriter', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def dropped(self) -> int:
+        return self._queue.dropped.variable
+
+    def prepare(self, record) -> logging.LogRecord:
+        """入队前合并日志内容并格式化异常信息，避免后台线程格式化时参数已被调用方修改"""
+        return _prepare_record(record)
+
+    def handle(self, record) -> bool:
+        rv = self.filter(record)
+        if rv:
+            self._queue.put(self.prepare(record))
+        return rv
+
+    def emit(self, record) -> None:
+        self._queue.put(self.prepare(record))
+
+    def _monitor(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    break
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            except Exception:
+                self.handleError(record)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        if self._thread.is_alive():
+            self._queue.join()
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        for handler in self.handlers:
+            try:
+                handler.flush()
+                handler.close()
+            except (OSError, ValueError):
+                # 与 logging.shutdown 一致，忽略退出阶段输出流已被关闭的情况
+                pass
+        atexit.unregister(self.close)
+        super().close()
+
+
+def _file_handler(
+        filename: str, encoding: str, max_bytes: int, backup_count: int, struct: bool, simplify: bool,
+        simplify_path: bool, rotate_interval: float, compression: Optional[str], disk_budget: int
+) -> RotatingFileHandler:
+    """文件日志处理器的构造函数"""
+    if rotate_interval > 0 or compression or disk_budget > 0:
+        # 按大小及时间轮转，分段文件由后台线程压缩及清理
+        handler = CompressedRotatingFileHandler(
+            filename, max_bytes=max_bytes, interval=rotate_interval, backup_count=backup_count,
+            disk_budget=disk_budget, compression=compression, encoding=encoding)
+    elif struct:
+        handler = StructFileHandler(filename, encoding=encoding, maxBytes=max_bytes, backupCount=backup_count)
+    else:
+        handler = RotatingFileHandler(filename, encoding=encoding, maxBytes=max_bytes, backupCount=backup_count)
+    if struct:
+        # 结构化输出，可通过 iter_struct_log 按等级及时间范围读取
+        handler.setFormatter(StructFormatter())
+    else:
+        handler.setFormatter(TintFormatter(False, simplify, simplify_path))
+    return handler
+
+
+def _collect(address: str, authkey: bytes, ready, fsync_interval: float, *args) -> None:
+    """日志收集进程的入口函数，接收各进程发送的日志记录并批量写入文件，按间隔执行 fsync"""
+    handler = _file_handler(*args)
+    listener = Listener(address, authkey=authkey)
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                connections.append(listener.accept())
+            except (OSError, EOFError):
+                break
+
+    Thread(target=accept, name='LogCollectorAccept', daemon=True).start()
+    ready.set()
+
+    running, fsync_time = True, time.monotonic()
+    while running:
+        for conn in wait(list(connections), timeout=0.2):
+            try:
+                while conn.poll():
+                    record = conn.recv()
+                    if record is None:
+                        running = False
+                        break
+                    if handler.shouldRollover(record):
+                        handler.doRollover()
+                    handler.stream.write(handler.format(record) + handler.terminator)
+            except (OSError, EOFError):
+                connections.remove(conn)
+                conn.close()
+        if handler.stream is not None:
+            handler.stream.flush()
+            if fsync_interval > 0 and time.monotonic() - fsync_time >= fsync_interval:
+                os.fsync(handler.stream.fileno())
+                fsync_time = time.monotonic()
+
+    # 写入其他进程已发送但尚未处理的日志记录后退出
+    for conn in connections:
+        try:
+            while conn.poll():
+                record = conn.recv()
+                if record is not None:
+                    handler.handle(record)
+        except (OSError, EOFError):
+            pass
+        conn.close()
+    listener.close()
+    handler.close()
+
+
+class CollectorHandler(logging.Handler):
+    """
+    多进程日志处理器，各进程（包括 fork 或 spawn 方式创建的子进程）将日志记录发送至唯一的收集进程，
+    由收集进程统一写入及轮转日志文件，避免多个进程各自轮转同一文件
+    """
+    _environ_key = 'PY3SCRIPTS_LOG_COLLECTOR'
+
+    def __init__(self, address: str, collector: Optional[Process] = None, name: Optional[str] = None):
+        super().__init__()
+        self._address = address
+        self._name = name
+        self._collector = collector
+        self._conn = None
+        self._pid = None
+        # 仅启动收集进程的进程可检查及等待收集进程，fork 方式创建的子进程会继承此处理器
+        self._owner = os.getpid()
+        if collector is not None:
+            atexit.register(self.close)
+
+    @classmethod
+    def start(cls, name: str, fsync_interval: float, *args) -> 'CollectorHandler':
+        """获取当前日志器的收集进程地址，不存在时启动收集进程并通过环境变量共享给子进程"""
+        addresses = json.loads(os.environ.get(cls._environ_key, '{}'))
+        if name in addresses:
+            return cls(addresses[name])
+        address = arbitrary_address(default_family)
+        ready = Event()
+        collector = Process(
+            target=_collect, args=(address, current_process().authkey, ready, fsync_interval, *args),
+            name='LogCollector', daemon=True)
+        collector.start()
+        ready.wait()
+        addresses[name] = address
+        os.environ[cls._environ_key] = json.dumps(addresses)
+        return cls(address, collector, name)
+
+    def prepare(self, record) -> logging.LogRecord:
+        """合并日志内容并格式化异常信息，确保日志记录可被序列化"""
+        return _prepare_record(record)
+
+    def emit(self, record) -> None:
+        try:
+            if self._pid != os.getpid():
+                # 首次发送或 fork 后的子进程需重新建立连接
+                self._conn = Client(self._address, authkey=current_process().authkey)
+                self._pid = os.getpid()
+            self._conn.send(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        if self._collector is not None and self._owner == os.getpid():
+            # 收集进程停止后不再共享其地址，之后创建的同名日志器及子进程将启动新的收集进程
+            addresses = json.loads(os.environ.get(self._environ_key, '{}'))
+            if addresses.get(self._name) == self._address:
+                del addresses[self._name]
+                os.environ[self._environ_key] = json.dumps(addresses)
+        if self._collector is not None and self._owner == os.getpid() and self._collector.is_alive():
+            try:
+                if self._pid != os.getpid():
+                    self._conn = Client(self._address, authkey=current_process().authkey)
+                    self._pid = os.getpid()
+                self._conn.send(None)
+            except OSError:
+                pass
+            self._collector.join()
+            atexit.unregister(self.close)
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+            self._conn = None
+        super().close()
+
+
 class Logger:
     def __init__(
             self, name: str = 'root', level: int = INFO, simplify: bool = True, simplify_path: bool = False,
             *,
             console: bool = True, color: bool = True, file: Union[bool, str] = False,
-            file_encoding: str = 'utf-8', file_max_bytes: int = 0, file_backup_count: int = 0
+            file_encoding: str = 'utf-8', file_max_bytes: int = 0, file_backup_count: int = 0,
+            file_struct: bool = False, file_rotate_interval: float = 0, file_compression: Optional[str] = None,
+            file_disk_budget: int = 0, multiprocess: bool = False, fsync_interval: float = 1.0,
+            async_mode: bool = False, queue_size: int = 10000, overflow: str = OVERFLOW_BLOCK,
+            rate_limit: float = 0, rate_burst: int = 10, sample_rate: float = 1.0, summary_interval: float = 10.0
     ):
         # 初始化日志对象并日志输出等级
         self._logger = logging.getLogger(name)
         self._logger.setLevel(level)
 
-        if console and not any(isinstance(handler, logging.StreamHandler) for handler in self._logger.handlers):
+        # 已配置的日志处理器（异步模式下由 AsyncHandler 托管）
+        exist_handlers = []
+        for handler in self._logger.handlers:
+            exist_handlers.extend(handler.handlers if isinstance(handler, AsyncHandler) else [handler])
+        handlers = []
+
+        if console and not any(isinstance(handler, logging.StreamHandler) for handler in exist_handlers):
             # 配置日志输出到标准输出流
             console_handler = logging.StreamHandler(sys.stdout)
             console_handler.setFormatter(TintFormatter(color, simplify, simplify_path))
-            self._logger.addHandler(hdlr=console_handler)
+            handlers.append(console_handler)
 
-        if file and not any(isinstance(handler, logging.FileHandler) for handler in self._logger.handlers):
+        file_handler_types = (logging.FileHandler, CollectorHandler)
+        if file and not any(isinstance(handler, file_handler_types) for handler in exist_handlers):
             # 配置日志输出到文件
             if isinstance(file, str):
                 filename = file
             else:
                 filename = '{} {}.log'.format(time.strftime('%Y%m%d_%H%M%S', time.localtime()), name)
-            file_handler = RotatingFileHandler(
-                filename, encoding=file_encoding, maxBytes=file_max_bytes, backupCount=file_backup_count)
-            file_handler.setFormatter(TintFormatter(False, simplify, simplify_path))
-            self._logger.addHandler(hdlr=file_handler)
+            file_args = (
+                filename, file_encoding, file_max_bytes, file_backup_count, file_struct, simplify, simplify_path,
+                file_rotate_interval, file_compression, file_disk_budget)
+            if multiprocess:
+                # 多进程输出，日志记录发送至唯一的收集进程统一写入文件
+                file_handler = CollectorHandler.start(name, fsync_interval, *file_args)
+            else:
+                file_handler = _file_handler(*file_args)
+            handlers.append(file_handler)
+
+        if handlers and async_mode:
+            # 配置异步输出，调用线程仅负责入队，由后台线程统一格式化及写入
+            self._logger.addHandler(hdlr=AsyncHandler(handlers, queue_size, overflow))
+        else:
+            for handler in handlers:
+                self._logger.addHandler(hdlr=handler)
+
+        if (rate_limit > 0 or sample_rate < 1) and \
+                not any(isinstance(_filter, RateLimitFilter) for _filter in self._logger.filters):
+            # 配置按调用位置限流及 DEBUG、INFO 日志采样
+            self._logger.addFilter(RateLimitFilter(rate_limit, rate_burst, sample_rate, summary_interval))
 
     @property
     def logger(self):
         return self._logger
 
-    def debug(self, msg, *args, stacklevel: int = 2, **kwargs) -> Optional[callable]:
-        if traceback.extract_stack()[-2][3].startswith('@') or (args and isfunction(args[-1])):
-            function = None
-            if args and isfunction(args[-1]):
-                *args, function = args
-            if function is None:
-                return partial(self.debug, msg, *args, **kwargs)
+    def flush(self) -> None:
+        """等待异步队列中的日志全部写出，并刷新所有日志处理器"""
+        for handler in self._logger.handlers:
+            handler.flush()
 
-            @wraps(function)
-            def wrapped(*func_args, **func_kwargs):
-                self._logger.debug(msg, *args, stacklevel=stacklevel, **kwargs)
-                return function(*func_args, **func_kwargs)
+    def _decorate(self, level: int, msg, args: tuple, kwargs: dict, stacklevel: int, function: callable) -> callable:
+        """装饰器包装函数，被装饰函数每次调用前输出一条日志"""
 
-            return wrapped
-        else:
+        @wraps(function)
+        def wrapped(*func_args, **func_kwargs):
+            self._logger.log(level, msg, *args, stacklevel=stacklevel, **kwargs)
+            return function(*func_args, **func_kwargs)
+
+        return wrapped
+
+    def trace(self, level: int, msg, *args, stacklevel: int = 2, **kwargs) -> callable:
+        """
+        装饰器调用，例如 @logger.trace(INFO, 'message')
+        注：日志方法不检查调用栈，@logger.info('message') 形式的装饰器用法已不再支持，需显式使用此方法
+        """
+        return partial(self._decorate, level, msg, args, kwargs, stacklevel)
+
+    def debug(self, msg, *args, stacklevel: int = 2, **kwargs) -> Optional[callable]:
+        if self._logger.isEnabledFor(DEBUG):
+            if args and isfunction(args[-1]):
+                return self._decorate(DEBUG, msg, args[:-1], kwargs, stacklevel, args[-1])
             self._logger.debug(msg, *args, stacklevel=stacklevel, **kwargs)
+        elif args and isfunction(args[-1]):
+            # 显式传入被装饰函数时，无论日志等级是否启用均返回包装函数
+            return self._decorate(DEBUG, msg, args[:-1], kwargs, stacklevel, args[-1])
 
     def info(self, msg, *args, stacklevel: int = 2, **kwargs) -> Optional[callable]:
-        if traceback.extract_stack()[-2][3].startswith('@') or (args and isfunction(args[-1])):
-            function = None
+        if self._logger.isEnabledFor(INFO):
             if args and isfunction(args[-1]):
-                *args, function = args
-            if function is None:
-                return partial(self.info, msg, *args, **kwargs)
-
-            @wraps(function)
-            def wrapped(*func_args, **func_kwargs):
-                self._logger.info(msg, *args, stacklevel=stacklevel, **kwargs)
-                return function(*func_args, **func_kwargs)
-
-            return wrapped
-        else:
+                return self._decorate(INFO, msg, args[:-1], kwargs, stacklevel, args[-1])
             self._logger.info(msg, *args, stacklevel=stacklevel, **kwargs)
+        elif args and isfunction(args[-1]):
+            # 显式传入被装饰函数时，无论日志等级是否启用均返回包装函数
+            return self._decorate(INFO, msg, args[:-1], kwargs, stacklevel, args[-1])
 
     def warning(self, msg, *args, stacklevel: int = 2, **kwargs) -> Optional[callable]:
-        if traceback.extract_stack()[-2][3].startswith('@') or (args and isfunction(args[-1])):
-            function = None
+        if self._logger.isEnabledFor(WARNING):
             if args and isfunction(args[-1]):
-                *args, function = args
-            if function is None:
-                return partial(self.warning, msg, *args, **kwargs)
-
-            @wraps(function)
-            def wrapped(*func_args, **func_kwargs):
-                self._logger.warning(msg, *args, stacklevel=stacklevel, **kwargs)
-                return function(*func_args, **func_kwargs)
-
-            return wrapped
-        else:
+                return self._decorate(WARNING, msg, args[:-1], kwargs, stacklevel, args[-1])
             self._logger.warning(msg, *args, stacklevel=stacklevel, **kwargs)
+        elif args and isfunction(args[-1]):
+            # 显式传入被装饰函数时，无论日志等级是否启用均返回包装函数
+            return self._decorate(WARNING, msg, args[:-1], kwargs, stacklevel, args[-1])
 
     # set alias name
     warn = warning
 
     def error(self, msg, *args, stacklevel: int = 2, **kwargs) -> Optional[callable]:
-        if traceback.extract_stack()[-2][3].startswith('@') or (args and isfunction(args[-1])):
-            function = None
+        if self._logger.isEnabledFor(ERROR):
             if args and isfunction(args[-1]):
-                *args, function = args
-            if function is None:
-                return partial(self.error, msg, *args, **kwargs)
-
-            @wraps(function)
-            def wrapped(*func_args, **func_kwargs):
-                self._logger.error(msg, *args, stacklevel=stacklevel, **kwargs)
-                return function(*func_args, **func_kwargs)
-
-            return wrapped
-        else:
+                return self._decorate(ERROR, msg, args[:-1], kwargs, stacklevel, args[-1])
             self._logger.error(msg, *args, stacklevel=stacklevel, **kwargs)
+        elif args and isfunction(args[-1]):
+            # 显式传入被装饰函数时，无论日志等级是否启用均返回包装函数
+            return self._decorate(ERROR, msg, args[:-1], kwargs, stacklevel, args[-1])
 
     def exception(self, msg, *args, exc_info=True, stacklevel: int = 2, **kwargs):
         self._logger.error(msg, *args, exc_info=exc_info, stacklevel=stacklevel, **kwargs)
@@ -315,5 +912,17 @@ class Logger:
     # set alias name
     fatal = critical
 
+    def report_metrics(self, metrics: dict, interval: float = 60, level: int = INFO) -> MetricsReporter:
+        """
+        每隔 interval 秒输出一次指标摘要，例如 logger.report_metrics({'rows': meter, 'latency': histogram})
+        返回的 MetricsReporter 可调用 stop 停止
+        """
+        return MetricsReporter(self, metrics, interval, level)
+
 
-__all__ = ['Logger', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL', 'WARN', 'FATAL']
+__all__ = [
+    'Logger', 'AsyncHandler', 'CollectorHandler', 'CompressedRotatingFileHandler', 'LogQueue', 'RateLimitFilter',
+    'StructFormatter', 'StructFileHandler', 'iter_struct_log',
+    'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL', 'WARN', 'FATAL',
+    'OVERFLOW_BLOCK', 'OVERFLOW_DROP_OLDEST', 'OVERFLOW_DROP_DEBUG', 'COMPRESSION_GZIP', 'COMPRESSION_ZSTD',
+]
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Author      : YongJie-Xie
+@Contact     : fsswxyj@qq.com
+@DateTime    : 0000-00-00 00:00
+@Description : 多线程指标统计类，支持滑动窗口速率、直方图及百分位数统计、计时、定期输出摘要及 Prometheus 文本格式导出等。
+@FileName    : metrics.py
+@License     : MIT License
+@ProjectName : Py3Scripts
+@Software    : PyCharm
+@Version     : 1.1
+"""
+import logging
+import math
+import time
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from typing import List
+
+# 默认的耗时分桶上限（秒），覆盖 0.5 毫秒至 10 秒
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def prometheus_labels(labels: dict) -> str:
+    """Prometheus 标签格式化函数，例如 {'table': 'test'} -> '{table="test"}'"""
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('{}="{}"'.format(
+        key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    ) for key, value in labels.items())
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """
+        多线程同步的分桶直方图，记录落入各分桶上限的观测次数、观测总数及观测值之和
+        :param tuple buckets:
+            分桶上限列表，默认为 LATENCY_BUCKETS
+        """
+        self._buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._mutex = Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._buckets, value)
+        with self._mutex:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """返回 {'buckets': {分桶上限: 累计次数}, 'count': 观测总数, 'sum': 观测值之和}"""
+        with self._mutex:
+            counts, count, total = list(self._counts), self._count, self._sum
+        buckets, cumulative = {}, 0
+        for bound, number in zip(self._buckets + (float('inf'),), counts):
+            cumulative += number
+            buckets[bound] = cumulative
+        return {'buckets': buckets, 'count': count, 'sum': total}
+
+    def time(self) -> 'Timer':
+        return Timer(self)
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        return 'count={} mean={:.3f}ms'.format(
+            snapshot['count'], snapshot['sum'] / snapshot['count'] * 1000 if snapshot['count'] else 0)
+
+    def prometheus(self, name: str, labels: dict = None) -> List[str]:
+        """按 Prometheus 文本格式输出 <name>_bucket、<name>_sum 及 <name>_count 样本行"""
+        snapshot, labels = self.snapshot(), labels or {}
+        lines = ['{}_bucket{} {}'.format(
+            name, prometheus_labels({**labels, 'le': '+Inf' if bound == float('inf') else repr(float(bound))}), number
+        ) for bound, number in snapshot['buckets'].items()]
+        lines.append('{}_sum{} {!r}'.format(name, prometheus_labels(labels), snapshot['sum']))
+        lines.append('{}_count{} {}'.format(name, prometheus_labels(labels), snapshot['count']))
+        return lines
+
+
+class HdrHistogram:
+    def __init__(self, highest: float = 3600, significant_figures: int = 2, unit: float = 1e-6):
+        """
+        HDR 风格的对数线性分桶直方图，记录耗时为 O(1)，占用固定内存，百分位数的相对误差不超过有效数字对应的精度
+        :param float highest:
+            可记录的最大值，超过时按最大值记录，默认值为 3600（秒）
+        :param int significant_figures:
+            有效数字位数，例如 2 表示相对误差不超过 1%，默认值为 2
+        :param float unit:
+            最小分辨率，默认值为 1e-6（秒），即 1 微秒
+        """
+        self._unit = unit
+        self._highest = max(int(highest / unit), 1)
+        # 每个指数区间内的线性子分桶数量，保证子分桶宽度与取值之比不超过精度要求
+        self._bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_count = 1 << self._bits
+        self._half = self._sub_count >> 1
+        self._counts = [0] * (self._index(self._highest) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._min = self._max = None
+        self._mutex = Lock()
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self._bits
+        if shift <= 0:
+            return value
+        return self._sub_count + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _highest_equivalent(self, index: int) -> int:
+        """分桶内的最大取值（与 HdrHistogram 一致，百分位数返回分桶上限）"""
+        if index < self._sub_count:
+            return index
+        shift, sub = divmod(index - self._sub_count, self._half)
+        return ((sub + self._half + 1) << (shift + 1)) - 1
+
+    def observe(self, value: float) -> None:
+        index = self._index(min(max(int(value / self._unit), 0), self._highest))
+        with self._mutex:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if self._min is None or value < self._min:
+                self._min = value
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def percentiles(self, percents: tuple = (50, 90, 99, 99.9)) -> dict:
+        """返回 {百分位: 取值}，例如 {50: 0.0012, 99: 0.0105}，无记录时取值为 0"""
+        result = {}
+        with self._mutex:
+            if not self._count:
+                return {percent: 0 for percent in percents}
+            # 先舍入再向上取整，避免 99.9 / 100 * 10000 = 9990.000000000002 之类的浮点误差多取一个记录
+            targets = sorted(
+                (max(math.ceil(round(percent * self._count / 100, 9)), 1), percent) for percent in percents)
+            cumulative, position = 0, 0
+            for index, number in enumerate(self._counts):
+                cumulative += number
+                while position < len(targets) and cumulative >= targets[position][0]:
+                    value = min(self._highest_equivalent(index) * self._unit, self._max)
+                    result[targets[position][1]] = max(value, self._min)
+                    position += 1
+                if position >= len(targets):
+                    break
+        return {percent: result[percent] for percent in percents}
+
+    def percentile(self, percent: float) -> float:
+        return self.percentiles((percent,))[percent]
+
+    def snapshot(self, percents: tuple = (50, 90, 99, 99.9)) -> dict:
+        values = self.percentiles(percents)
+        with self._mutex:
+            count, total, minimum, maximum = self._count, self._sum, self._min, self._max
+        return {
+            'count': count, 'sum': total, 'min': minimum or 0, 'max': maximum or 0,
+            'mean': total / count if count else 0, 'percentiles': values,
+        }
+
+    def reset(self) -> None:
+        with self._mutex:
+            self._counts = [0] * len(self._counts)
+            self._count = 0
+            self._sum = 0.0
+            self._min = self._max = None
+
+    def time(self) -> 'Timer':
+        return Timer(self)
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        return 'count={} min={:.3f}ms mean={:.3f}ms {} max={:.3f}ms'.format(
+            snapshot['count'], snapshot['min'] * 1000, snapshot['mean'] * 1000,
+            ' '.join('p{:g}={:.3f}ms'.format(percent, value * 1000)
+                     for percent, value in snapshot['percentiles'].items()),
+            snapshot['max'] * 1000)
+
+
+class RateMeter:
+    def __init__(self, windows: tuple = (1, 10, 60)):
+        """
+        滑动窗口速率统计，按秒分槽的环形数组记录事件数量，记录耗时为 O(1)，占用固定内存
+        :param tuple windows:
+            统计窗口的秒数，默认值为 (1, 10, 60)
+        """
+        self._windows = tuple(sorted(windows))
+        # 多保留一个槽位，避免当前秒覆盖最大窗口内最早的一秒
+        self._counts = [0] * (self._windows[-1] + 1)
+        self._stamps = [-1] * (self._windows[-1] + 1)
+        self._total = 0
+        self._mutex = Lock()
+
+    def mark(self, number: int = 1) -> None:
+        second = int(time.monotonic())
+        index = second % len(self._counts)
+        with self._mutex:
+            if self._stamps[index] != second:
+                self._stamps[index] = second
+                self._counts[index] = 0
+            self._counts[index] += number
+            self._total += number
+
+    @property
+    def count(self) -> int:
+        with self._mutex:
+            return self._total
+
+    def rate(self, window: int) -> float:
+        """最近 window 个完整秒内的每秒事件数量（不包含当前未结束的一秒）"""
+        now, size = int(time.monotonic()), len(self._counts)
+        with self._mutex:
+            total = sum(self._counts[second % size] for second in range(now - window, now)
+                        if self._stamps[second % size] == second)
+        return total / window
+
+    def rates(self) -> dict:
+        return {window: self.rate(window) for window in self._windows}
+
+    def summary(self) -> str:
+        return 'count={} {}'.format(self.count, ' '.join(
+            'rate_{}s={:.1f}/s'.format(window, rate) for window, rate in self.rates().items()))
+
+
+class Timer:
+    def __init__(self, histogram=None, meter: RateMeter = None):
+        """
+        计时上下文管理器，退出时将耗时（秒）记录到直方图，并在速率统计中记录一次事件
+        with Timer(histogram, meter) as timer: ...  或  with histogram.time(): ...
+        """
+        self._histogram = histogram
+        self._meter = meter
+        self._start = None
+        self.elapsed = None
+
+    def __enter__(self) -> 'Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.elapsed = time.perf_counter() - self._start
+        if self._histogram is not None:
+            self._histogram.observe(self.elapsed)
+        if self._meter is not None:
+            self._meter.mark()
+
+
+class MetricsReporter:
+    def __init__(self, logger, metrics: dict, interval: float = 60, level: int = logging.INFO):
+        """
+        定期输出指标摘要，每隔 interval 秒在后台线程中为每个指标输出一条日志，参考 Logger.report_metrics
+        :param logger:
+            Logger 或 logging.Logger 对象
+        :param dict metrics:
+            {名称: 指标}，指标为 RateMeter、HdrHistogram、Histogram 或 Counter 等，提供 summary 方法时输出其返回值
+        """
+        self._logger = getattr(logger, 'logger', logger)
+        self._metrics = metrics
+        self._interval = interval
+        self._level = level
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name='MetricsReporter', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self.report()
+
+    def report(self) -> None:
+        if not self._logger.isEnabledFor(self._level):
+            return
+        for name, metric in list(self._metrics.items()):
+            summary = metric.summary() if hasattr(metric, 'summary') else str(metric)
+            self._logger.log(self._level, '[metrics] %s: %s', name, summary)
+
+    def stop(self, report: bool = True) -> None:
+        """停止定期输出，report 为 True 时最后输出一次摘要"""
+        self._stopped.set()
+        self._thread.join()
+        if report:
+            self.report()
+
+
+__all__ = [
+    'Histogram', 'HdrHistogram', 'RateMeter', 'Timer', 'MetricsReporter', 'LATENCY_BUCKETS', 'prometheus_labels',
+]
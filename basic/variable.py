@@ -4,28 +4,50 @@
 @Author      : YongJie-Xie
 @Contact     : fsswxyj@qq.com
 @DateTime    : 0000-00-00 00:00
-@Description : 多线程同步变量类，支持多线程同步、标记为全局变量等。
+@Description : 多线程同步变量类，支持多线程同步、标记为全局变量、多进程共享内存等。
 @FileName    : variable.py
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.0
+@Version     : 1.2
 """
+import copy
+import multiprocessing
+import os
+import struct
+import weakref
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 from threading import Lock
-from typing import Generic, Optional, TypeVar
+from typing import TYPE_CHECKING, Callable, Generic, Iterator, Optional, TypeVar, Union
+
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
 
 T = TypeVar('T')
 
 
 class SyncVariable(Generic[T], metaclass=ABCMeta):
+    _read_mostly = False
+
     @abstractmethod
-    def __init__(self, default: Optional[T] = None):
+    def __init__(self, default: Optional[T] = None, read_mostly: bool = False):
+        """
+        :param T default:
+            初始值
+        :param bool read_mostly:
+            读多写少模式（RCU），读取时不加锁，读者之间互不阻塞，写入时整体替换对象而不是原地修改，
+            适用于频繁读取、偶尔更新的配置及查询字典等，默认值为 False
+        """
         self._variable = default
         self._variable_mutex = Lock()
+        self._read_mostly = read_mostly
 
     @property
     def variable(self) -> Optional[T]:
+        if self._read_mostly:
+            # 引用的读取是原子的，写入方只替换引用，读者总能得到完整的旧对象或新对象
+            return self._variable
         with self._variable_mutex:
             return self._variable
 
@@ -37,6 +59,60 @@ class SyncVariable(Generic[T], metaclass=ABCMeta):
     # set alias name
     var = variable
 
+    def _exclusive(self):
+        """读-改-写操作持有的锁，子类可覆盖以扩大互斥范围"""
+        return self._variable_mutex
+
+    def _load(self) -> Optional[T]:
+        """读取变量（调用方需持有 _exclusive 返回的锁）"""
+        return self._variable
+
+    def _store(self, value: Optional[T]) -> None:
+        """写入变量（调用方需持有 _exclusive 返回的锁）"""
+        self._variable = value
+
+    def update(self, function: Callable[[Optional[T]], Optional[T]]) -> Optional[T]:
+        """
+        在一次加锁内以 function(旧值) 的返回值更新变量，并返回新值，例如 variable.update(lambda v: v + 1)
+        注：读多写少模式下 function 不能原地修改旧值，需返回新对象，例如 variable.update(lambda v: {**v, 'k': 1})
+        """
+        with self._exclusive():
+            value = function(self._load())
+            self._store(value)
+            return value
+
+    def compare_and_set(self, expected: Optional[T], value: Optional[T]) -> bool:
+        """当前值等于 expected 时更新为 value 并返回 True，否则不更新并返回 False"""
+        with self._exclusive():
+            if self._load() != expected:
+                return False
+            self._store(value)
+            return True
+
+    def get_and_set(self, value: Optional[T]) -> Optional[T]:
+        """更新为 value 并返回旧值"""
+        with self._exclusive():
+            previous = self._load()
+            self._store(value)
+            return previous
+
+    @contextmanager
+    def locked(self) -> Iterator['LockedVariable']:
+        """
+        持有锁的作用域，作用域内通过 value 属性读写变量，例如
+        with variable.locked() as v:
+            v.value = v.value + 1
+        读多写少模式下 value 为旧值的浅拷贝，可原地修改，作用域正常退出时整体替换，发生异常时丢弃
+        注：作用域内不能再调用本对象的加锁方法，否则将死锁
+        """
+        with self._exclusive():
+            if not self._read_mostly:
+                yield LockedVariable(self)
+                return
+            snapshot = SnapshotVariable(self, copy.copy(self._load()))
+            yield snapshot
+            self._store(snapshot.value)
+
     def __str__(self) -> str:
         return str(self.variable)
 
@@ -44,6 +120,39 @@ class SyncVariable(Generic[T], metaclass=ABCMeta):
         return '<Sync {}(variable={})>'.format(self.__class__.__name__, self.variable)
 
 
+class LockedVariable(Generic[T]):
+    """SyncVariable.locked 作用域内的变量访问对象，读写时不再加锁"""
+    __slots__ = ('_target',)
+
+    def __init__(self, target: SyncVariable):
+        self._target = target
+
+    @property
+    def value(self) -> Optional[T]:
+        return self._target._load()
+
+    @value.setter
+    def value(self, value: Optional[T]) -> None:
+        self._target._store(value)
+
+
+class SnapshotVariable(LockedVariable):
+    """读多写少模式下 SyncVariable.locked 作用域内的变量访问对象，读写旧值的副本，由作用域退出时整体替换"""
+    __slots__ = ('_value',)
+
+    def __init__(self, target: SyncVariable, value: Optional[T]):
+        super().__init__(target)
+        self._value = value
+
+    @property
+    def value(self) -> Optional[T]:
+        return self._value
+
+    @value.setter
+    def value(self, value: Optional[T]) -> None:
+        self._value = value
+
+
 class GlobalSyncVariable(SyncVariable, metaclass=ABCMeta):
     _instance = {}
     _instance_lock = Lock()
@@ -61,4 +170,70 @@ class GlobalSyncVariable(SyncVariable, metaclass=ABCMeta):
         return '<GlobalSync {}(variable={})>'.format(self.__class__.__name__, self.variable)
 
 
-__all__ = ['SyncVariable', 'GlobalSyncVariable']
+class SharedSyncVariable(SyncVariable):
+    def __init__(self, default: Union[int, float] = 0, typecode: str = 'q', context=None):
+        """
+        多进程同步变量，数值存放在共享内存的定长槽位中，读写由进程间锁保护，
+        可作为 Process 参数在 fork 及 spawn 启动方式下传递给子进程，由创建进程在回收或退出时释放共享内存，
+        依赖 multiprocessing.shared_memory，需要 Python 3.8 及以上版本（在创建时导入，不影响其他类在 Python 3.7 下使用）
+        :param int|float default:
+            初始值
+        :param str typecode:
+            槽位的数值类型，同 struct 模块的格式字符，例如 q（64 位有符号整数）、d（双精度浮点数），默认值为 q
+        :param context:
+            用于创建进程间锁的 multiprocessing 上下文，默认使用 spawn 上下文（fork 上下文的锁无法传递给 spawn 子进程）
+        """
+        if typecode not in ('b', 'B', 'h', 'H', 'i', 'I', 'l', 'L', 'q', 'Q', 'f', 'd'):
+            raise ValueError('暂不支持的数值类型')
+        from multiprocessing.shared_memory import SharedMemory
+        self._typecode = typecode
+        self._memory = SharedMemory(create=True, size=struct.calcsize(typecode))
+        self._slot = self._memory.buf.cast(typecode)
+        self._slot[0] = default
+        self._variable_mutex = (context or multiprocessing.get_context('spawn')).Lock()
+        self._finalizer = weakref.finalize(
+            self, SharedSyncVariable._release, self._slot, self._memory, os.getpid())
+
+    @staticmethod
+    def _release(slot: memoryview, memory: 'SharedMemory', owner: Optional[int]) -> None:
+        slot.release()
+        memory.close()
+        if owner == os.getpid():
+            memory.unlink()
+
+    def __getstate__(self) -> dict:
+        return {'name': self._memory.name, 'typecode': self._typecode, 'mutex': self._variable_mutex}
+
+    def __setstate__(self, state: dict) -> None:
+        from multiprocessing.shared_memory import SharedMemory
+        self._typecode = state['typecode']
+        self._memory = SharedMemory(name=state['name'])
+        self._slot = self._memory.buf.cast(self._typecode)
+        self._variable_mutex = state['mutex']
+        self._finalizer = weakref.finalize(self, SharedSyncVariable._release, self._slot, self._memory, None)
+
+    def close(self) -> None:
+        """释放共享内存（创建进程中调用时同时删除共享内存）"""
+        self._finalizer()
+
+    @property
+    def variable(self) -> Union[int, float]:
+        with self._variable_mutex:
+            return self._slot[0]
+
+    @variable.setter
+    def variable(self, value: Union[int, float]) -> None:
+        with self._variable_mutex:
+            self._slot[0] = value
+
+    # set alias name
+    var = variable
+
+    def _load(self) -> Union[int, float]:
+        return self._slot[0]
+
+    def _store(self, value: Union[int, float]) -> None:
+        self._slot[0] = value
+
+
+__all__ = ['SyncVariable', 'GlobalSyncVariable', 'SharedSyncVariable', 'LockedVariable', 'SnapshotVariable']
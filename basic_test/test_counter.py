@@ -9,12 +9,14 @@
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.1
+@Version     : 1.2
 """
+import multiprocessing
+import sys
 import time
 from threading import Thread
 
-from basic import Logger, Counter, GlobalCounter
+from basic import Logger, WARNING, Counter, GlobalCounter, SharedCounter, ShardedCounter, CONSISTENCY_STRICT
 
 logger = Logger('test_counter', simplify=False)
 
@@ -25,7 +27,7 @@ def accumulate(target, number):
         logger.info('[%s] now: %s', target.__class__.__name__, target)
 
 
-@logger.warning('Testing Counter Object.')
+@logger.trace(WARNING, 'Testing Counter Object.')
 def test_counter():
     thread_list = []
     for i in range(3):
@@ -36,7 +38,7 @@ def test_counter():
         thread.join()
 
 
-@logger.warning('Testing GlobalCounter Object.')
+@logger.trace(WARNING, 'Testing GlobalCounter Object.')
 def test_global_counter():
     thread_list = []
     for i in range(3):
@@ -47,10 +49,107 @@ def test_global_counter():
         thread.join()
 
 
+@logger.trace(WARNING, 'Testing ShardedCounter Object.')
+def test_sharded_counter():
+    for counter in (ShardedCounter(0), ShardedCounter(0, consistency=CONSISTENCY_STRICT)):
+        thread_list = []
+        for i in range(3):
+            thread_list.append(Thread(target=accumulate, args=(counter, 10)))
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        assert counter.variable == 30
+
+
+def shared_increase(target, number, barrier=None):
+    if barrier is not None:
+        barrier.wait()
+    for _ in range(number):
+        target.increase()
+
+
+@logger.trace(WARNING, 'Testing SharedCounter Object.')
+def test_shared_counter():
+    if sys.version_info < (3, 8):
+        # multiprocessing.shared_memory 需要 Python 3.8 及以上版本
+        logger.warning('Skipped: shared memory requires Python 3.8+')
+        return
+    counter = SharedCounter(0)
+    process_list = []
+    for i in range(3):
+        process_list.append(multiprocessing.Process(target=shared_increase, args=(counter, 1000)))
+    for process in process_list:
+        process.start()
+    for process in process_list:
+        process.join()
+    logger.info('[%s] now: %s', counter.__class__.__name__, counter)
+    assert counter.variable == 3000
+    counter.close()
+
+
+def benchmark_shared_counter(number=200000):
+    """多进程累加的基准测试，统计 SharedCounter 在 fork 及 spawn 启动方式、不同进程数量下的每秒累加次数"""
+    if sys.version_info < (3, 8):
+        # multiprocessing.shared_memory 需要 Python 3.8 及以上版本
+        logger.warning('Skipped: shared memory requires Python 3.8+')
+        return
+    for method in ('fork', 'spawn'):
+        context = multiprocessing.get_context(method)
+        for process_count in (1, 4, 8):
+            counter = SharedCounter(0)
+            barrier = context.Barrier(process_count + 1)
+            process_list = [context.Process(target=shared_increase, args=(counter, number // process_count, barrier))
+                            for _ in range(process_count)]
+            for process in process_list:
+                process.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for process in process_list:
+                process.join()
+            elapsed = time.perf_counter() - start
+            logger.warning('[benchmark_shared_counter] %s, processes=%s: %.0f increments/sec',
+                           method, process_count, number // process_count * process_count / elapsed)
+            assert counter.variable == number // process_count * process_count
+            counter.close()
+
+
+def increase(target, number):
+    for _ in range(number):
+        target.increase()
+
+
+def benchmark_counter(number=1000000):
+    """多线程累加的基准测试，对比 Counter 与 ShardedCounter 在不同线程数量下的每秒累加次数"""
+    for thread_count in (1, 8, 32, 64):
+        for name, factory in (
+                ('Counter', Counter),
+                ('ShardedCounter(relaxed)', ShardedCounter),
+                ('ShardedCounter(strict)', lambda: ShardedCounter(consistency=CONSISTENCY_STRICT)),
+        ):
+            target = factory()
+            thread_list = [Thread(target=increase, args=(target, number // thread_count)) for _ in range(thread_count)]
+            start = time.perf_counter()
+            for thread in thread_list:
+                thread.start()
+            for thread in thread_list:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            logger.warning('[benchmark_counter] threads=%s, %s: %.0f increments/sec',
+                           thread_count, name, number // thread_count * thread_count / elapsed)
+            assert target.variable == number // thread_count * thread_count
+
+
 def main():
     test_counter()
     time.sleep(1)
     test_global_counter()
+    time.sleep(1)
+    test_sharded_counter()
+    time.sleep(1)
+    test_shared_counter()
+    benchmark_counter()
+    benchmark_shared_counter()
 
 
 if __name__ == '__main__':
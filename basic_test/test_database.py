@@ -11,19 +11,48 @@
 @Software    : PyCharm
 @Version     : 1.1
 """
-import MySQLdb
-from MySQLdb.cursors import SSCursor
+import asyncio
+import contextlib
+import importlib
+import logging
+import os
+import time
 
-from basic import Logger, DEBUG, MySQLDatabase
+from basic import Logger, DEBUG, INFO, MySQLDatabase, AsyncMySQLDatabase, PoolMetrics, ResultCache
 
 logger = Logger('test_database', level=DEBUG)
-database = MySQLDatabase(
-    host='xieyongjie.cn', port=3306, username='test', password='test', database='test',
-    creator=MySQLdb, cursor_class=SSCursor, logger=logger
-)
 
 
-@logger.info('=' * 120)
+def database_options(prefix: str = 'PY3SCRIPTS_MYSQL_', host: str = 'xieyongjie.cn') -> dict:
+    """
+    测试数据库的连接参数，可通过 <prefix>HOST、PORT、USERNAME、PASSWORD、DATABASE 及 CREATOR 环境变量指定，
+    CREATOR 为数据库接口模块名，默认值为 MySQLdb
+    """
+    creator = importlib.import_module(os.environ.get(prefix + 'CREATOR', 'MySQLdb'))
+    options = {
+        'host': os.environ.get(prefix + 'HOST', host),
+        'port': int(os.environ.get(prefix + 'PORT', 3306)),
+        'username': os.environ.get(prefix + 'USERNAME', 'test'),
+        'password': os.environ.get(prefix + 'PASSWORD', 'test'),
+        'database': os.environ.get(prefix + 'DATABASE', 'test'),
+        'creator': creator,
+        'logger': logger,
+    }
+    if creator.__name__ == 'MySQLdb':
+        options['cursor_class'] = importlib.import_module('MySQLdb.cursors').SSCursor
+    return options
+
+
+def benchmark_options() -> dict:
+    """基准测试的数据库连接参数，默认连接本地数据库 127.0.0.1:3306，可通过 PY3SCRIPTS_BENCHMARK_* 环境变量指定"""
+    return database_options('PY3SCRIPTS_BENCHMARK_', '127.0.0.1')
+
+
+database = MySQLDatabase(**database_options(), metrics=True)
+cached_database = MySQLDatabase(**database_options(), cache_max_bytes=1024 * 1024, cache_ttl=60)
+
+
+@logger.trace(INFO, '=' * 120)
 def create_table(table, columns_info):
     """
     Execute operation: CREATE TABLE IF NOT EXISTS `tmp_test_script`
@@ -35,7 +64,7 @@ def create_table(table, columns_info):
     logger.info('创建表结果：%s', rowcount)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
 def insert_one(table, columns, params):
     """
     Execute operation: INSERT INTO `tmp_test_script` (`a1`, `b2`, `c3`) VALUE (%s, %s, %s);
@@ -46,7 +75,7 @@ def insert_one(table, columns, params):
     logger.info('插入单条数据结果：%s', rowcount)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
 def insert_all(table, columns, seq_params):
     """
     Executemany operation: INSERT INTO `tmp_test_script` (`a1`, `b2`, `c3`) VALUES (%s, %s, %s);
@@ -57,7 +86,25 @@ def insert_all(table, columns, seq_params):
     logger.info('插入多条数据结果：%s', rowcount)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
+def insert_bulk(table, columns, rows):
+    """
+    Insert bulk progress: 2 rows, 1234 rows/sec
+    Insert bulk finished: 2 rows in 0.002 sec, 1234 rows/sec
+    """
+    logger.info('分块插入多条数据：`%s`', table)
+    rowcount = database.insert_bulk(table, columns, rows, chunk_rows=1)
+    logger.info('分块插入多条数据结果：%s', rowcount)
+    # 按编码后的字节数分块，中文等多字节字符及转义字符不会使分块超过字节数限制
+    cjk_rows = [(str(i), '中文日志内容' * 20, "含'引号") for i in range(100)]
+    chunks = list(MySQLDatabase._chunk(cjk_rows, 1000, 4096, 'utf-8'))
+    for chunk in chunks:
+        size = sum(len(value.encode('utf-8')) + value.count("'") + 4 for row in chunk for value in row)
+        assert size <= 4096, size
+    logger.info('多字节字符分块结果：%s 块', len(chunks))
+
+
+@logger.trace(INFO, '=' * 120)
 def select_one(table, columns):
     """
     Execute operation: SELECT `a1`, `b2`, `c3` FROM `tmp_test_script`;
@@ -68,7 +115,7 @@ def select_one(table, columns):
         logger.info('逐条查询数据结果：%s', row)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
 def update(table, values, columns, params):
     """
     Execute operation: UPDATE `tmp_test_script` SET `a1` = %s, `b2` = %s, `c3` = %s
@@ -80,7 +127,7 @@ def update(table, values, columns, params):
     logger.info('更新数据结果：%s', rowcount)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
 def select_many(table, columns, size=2):
     """
     Execute operation: SELECT `a1`, `b2`, `c3` FROM `tmp_test_script`;
@@ -91,7 +138,33 @@ def select_many(table, columns, size=2):
         logger.info('查询多条数据结果：%s', row)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
+def scan(table, columns, batch=2):
+    """
+    Execute operation: SELECT `a1`, `id` FROM `tmp_test_script_scan` ORDER BY `id` LIMIT %s;
+    Execute params: (2,)
+    Execute operation: SELECT `a1`, `id` FROM `tmp_test_script_scan` WHERE `id` > %s ORDER BY `id` LIMIT %s;
+    Execute params: (2, 2)
+    """
+    # 分页的 key 须为主键或唯一键，a1 等存在重复值的列会跳过分页边界上的重复行
+    scan_table = table + '_scan'
+    logger.info('分页扫描数据：`%s`', scan_table)
+    database.create_table(scan_table, {'id': 'int NOT NULL PRIMARY KEY', **dict.fromkeys(columns, 'varchar(255) NULL')})
+    database.insert_all(scan_table, ('id',) + columns, [(i, '1', '2', '3') for i in range(1, 6)])
+    checkpoint = None
+    for row in database.scan(scan_table, columns[:1], key='id', batch=batch, prefetch=True):
+        logger.info('分页扫描数据结果：%s', row)
+        # columns 不包含 key 时每行末尾追加 key 列，记录为检查点
+        checkpoint = row[-1]
+        if checkpoint == 3:
+            break
+    rows = list(database.scan(scan_table, columns[:1], key='id', batch=batch, start=checkpoint))
+    logger.info('从检查点 %s 继续分页扫描数据结果：%s', checkpoint, rows)
+    assert [row[-1] for row in rows] == [4, 5], rows
+    database.drop_table(scan_table)
+
+
+@logger.trace(INFO, '=' * 120)
 def delete(table, columns, params):
     """
     Execute operation: DELETE FROM `tmp_test_script` WHERE `a1` = %s AND `b2` = %s AND `c3` = %s;
@@ -102,7 +175,7 @@ def delete(table, columns, params):
     logger.info('删除数据结果：%s', rowcount)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
 def select_all(table, columns):
     """
     Execute operation: SELECT `a1`, `b2`, `c3` FROM `tmp_test_script`;
@@ -113,7 +186,7 @@ def select_all(table, columns):
     logger.info('查询全部数据结果：%s', rows)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
 def count(table, column):
     """
     Execute operation: SELECT COUNT(`a1`) FROM `tmp_test_script`;
@@ -124,7 +197,76 @@ def count(table, column):
     logger.info('统计表结果：%s', rowcount)
 
 
-@logger.info('=' * 120)
+@logger.trace(INFO, '=' * 120)
+def approximate_count(table, columns, params):
+    logger.info('近似统计表：`%s`', table)
+    logger.info('统计信息近似统计表结果：%r', database.count(table, approximate=True))
+    logger.info('增量维护近似统计表结果：%r', database.track_count(table))
+    database.insert_one(table, columns, params)
+    logger.info('写入后增量维护近似统计表结果：%r', database.count(table, approximate=True))
+
+
+@logger.trace(INFO, '=' * 120)
+def track_count_seeding(table, columns, params):
+    """精确计数的查询返回后、初始行数生效前写入一行，该行应计入增量维护的行数"""
+    logger.info('精确计数期间写入：`%s`', table)
+    execute = database.execute
+
+    @contextlib.contextmanager
+    def interleaved_execute(operation, *args, **kwargs):
+        with execute(operation, *args, **kwargs) as cur:
+            yield cur
+        if operation.startswith('SELECT COUNT(*)'):
+            # 删除实例属性以恢复原方法，避免之后 session 复制的会话对象沿用绑定在 database 上的方法
+            del database.execute
+            database.insert_one(table, columns, params)
+
+    database.execute = interleaved_execute
+    try:
+        rowcount = database.track_count(table)
+    finally:
+        database.__dict__.pop('execute', None)
+    logger.info('精确计数期间写入后增量维护近似统计表结果：%r', rowcount)
+    assert database.count(table, approximate=True) == database.count(table), '精确计数期间的写入未计入行数'
+
+
+@logger.trace(INFO, '=' * 120)
+def summarize_params():
+    """
+    Execute params: (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11)
+    Executemany seq_params: [('0', '0'), ..., ('9', '9')] ... (total: 100 items, about 1000 bytes)
+    """
+    seq_params = [(str(i), str(i)) for i in range(100)]
+    summary = database._summarize(seq_params)
+    logger.info('参数序列摘要：%s', summary)
+    assert summary == '{} ... (total: 100 items, about 1000 bytes)'.format(seq_params[:10]), summary
+    assert database._summarize(seq_params[:10]) == str(seq_params[:10])
+    # 单条语句的参数超过截断数量时同样完整输出
+    params = tuple(range(12))
+    messages = []
+    handler = logging.Handler()
+    handler.emit = lambda record: messages.append(record.getMessage())
+    logger.logger.addHandler(handler)
+    try:
+        with database.execute('SELECT {};'.format(', '.join(['%s'] * len(params))), params=params) as cur:
+            cur.fetchall()
+    finally:
+        logger.logger.removeHandler(handler)
+    assert 'Execute params: {}'.format(params) in messages, messages
+
+
+@logger.trace(INFO, '=' * 120)
+def metrics():
+    logger.info('连接池指标：%s', database.metrics_snapshot()['pool'])
+    for line in database.export_metrics().splitlines():
+        logger.info('Prometheus 指标：%s', line)
+    # 连接池缺少 DBUtils 内部属性时（例如 PersistentDB）仅返回等待及获取连接的统计
+    stats = PoolMetrics(object()).pool_stats()
+    logger.info('无连接池状态的指标：%s', stats)
+    assert stats == {'waiting': 0, 'checkouts': 0}, stats
+
+
+@logger.trace(INFO, '=' * 120)
 def drop_table(table):
     """
     Execute operation: DROP TABLE IF EXISTS `tmp_test_script`;
@@ -135,6 +277,115 @@ def drop_table(table):
     logger.info('删除表结果：%s', rowcount)
 
 
+def benchmark_bulk_load(table, columns_info, number=100000):
+    """并行分块写入的基准测试，对比单个与多个写入线程的每秒写入行数，连接 benchmark_options 指定的数据库"""
+    benchmark_database = MySQLDatabase(**benchmark_options(), max_connections=8)
+    columns = tuple(columns_info.keys())
+    for workers in (1, 4, 8):
+        benchmark_database.create_table(table, columns_info)
+        start = time.perf_counter()
+        rowcount = benchmark_database.bulk_load(
+            table, columns, ((str(i), str(i), str(i)) for i in range(number)), workers=workers)
+        elapsed = time.perf_counter() - start
+        logger.info('[benchmark_bulk_load] workers=%s: %s rows, %.0f rows/sec', workers, rowcount, number / elapsed)
+        benchmark_database.drop_table(table)
+
+
+@logger.trace(INFO, '=' * 120)
+def session(table, columns_info):
+    columns = tuple(columns_info.keys())
+    database.create_table(table, columns_info)
+    with database.session() as session_database:
+        session_database.insert_one(table, columns, ('1', '2', '3'))
+        try:
+            with session_database.session():
+                session_database.insert_one(table, columns, ('4', '5', '6'))
+                raise ValueError('回滚到保存点')
+        except ValueError as e:
+            logger.info('嵌套会话异常：%s', e)
+        logger.info('会话中查询结果：%s', session_database.select_all(table, columns))
+        # DDL 语句会隐式提交事务，在事务中调用时抛出异常且不执行
+        try:
+            session_database.drop_table(table)
+        except RuntimeError as e:
+            logger.info('事务中执行 DDL 异常：%s', e)
+        else:
+            raise AssertionError('事务中执行 DDL 未被拒绝')
+    logger.info('会话提交后统计表结果：%s', database.count(table))
+    assert database.count(table) == 1
+    with database.session(transaction=False) as session_database:
+        session_database.drop_table(table)
+
+
+@logger.trace(INFO, '=' * 120)
+def result_cache(table, columns_info):
+    columns = tuple(columns_info.keys())
+    cached_database.create_table(table, columns_info)
+    cached_database.insert_one(table, columns, ('1', '2', '3'))
+    for _ in range(3):
+        logger.info('缓存查询总数结果：%s', cached_database.count(table))
+    cached_database.insert_one(table, columns, ('4', '5', '6'))
+    logger.info('写入后缓存查询总数结果：%s', cached_database.count(table))
+    # 修改返回的结果不影响缓存
+    cached_database.select_all(table, columns, as_columns=True)[columns[0]].append('7')
+    cached_database.select_all(table, columns).clear()
+    logger.info('修改后缓存按列查询结果：%s', cached_database.select_all(table, columns, as_columns=True))
+    assert cached_database.select_all(table, columns, as_columns=True)[columns[0]] == ['1', '4']
+    assert len(cached_database.select_all(table, columns)) == 2
+    logger.info('查询结果缓存统计：%s', cached_database.cache_info())
+    cached_database.drop_table(table)
+    # 查询期间清空全部缓存时丢弃查询结果，即使该表此前没有缓存结果
+    cache = ResultCache(1024 * 1024)
+    generation = cache.generation(table)
+    cache.invalidate()
+    cache.put(table, ('SELECT 1;', None), [(1,)], generation)
+    assert cache.get(('SELECT 1;', None)) == (False, None)
+    # DictCursor 的查询结果为字典组成的元组，修改返回的行同样不影响缓存
+    cache.put(table, ('SELECT 2;', None), ({'a1': '1'}, {'a1': '4'}), cache.generation(table))
+    cache.get(('SELECT 2;', None))[1][0]['a1'] = '999'
+    assert cache.get(('SELECT 2;', None))[1] == ({'a1': '1'}, {'a1': '4'})
+
+
+async def _async_crud(table, columns_info):
+    columns = tuple(columns_info.keys())
+    async with AsyncMySQLDatabase(**database_options()) as async_database:
+        await async_database.create_table(table, columns_info)
+        await async_database.insert_all(table, columns, [('1', '2', '3'), ('4', '5', '6')])
+        async for row in async_database.select_one(table, columns):
+            logger.info('异步逐条查询结果：%s', row)
+        logger.info('异步查询总数结果：%s', await async_database.count(table, columns[0]))
+        await async_database.drop_table(table)
+
+
+@logger.trace(INFO, '=' * 120)
+def async_crud(table, columns_info):
+    asyncio.run(_async_crud(table, columns_info))
+
+
+async def _benchmark_async(table, column, number):
+    async with AsyncMySQLDatabase(**benchmark_options()) as async_database:
+        # 预热一轮，使连接池建立足够的连接，计时不包含建立连接的耗时
+        await asyncio.gather(*(async_database.count(table, column) for _ in range(40)))
+        start = time.perf_counter()
+        await asyncio.gather(*(async_database.count(table, column) for _ in range(number)))
+        return number / (time.perf_counter() - start)
+
+
+def benchmark_async(table, columns_info, number=1000):
+    """异步并发查询的基准测试，对比同步顺序查询与 number 个并发协程查询的每秒查询数，连接 benchmark_options 指定的数据库"""
+    benchmark_database = MySQLDatabase(**benchmark_options())
+    columns = tuple(columns_info.keys())
+    benchmark_database.create_table(table, columns_info)
+    benchmark_database.insert_one(table, columns, ('1', '2', '3'))
+    start = time.perf_counter()
+    for _ in range(number):
+        benchmark_database.count(table, columns[0])
+    logger.info('[benchmark_async] sequential: %.0f queries/sec', number / (time.perf_counter() - start))
+    logger.info('[benchmark_async] concurrent: %.0f queries/sec',
+                asyncio.run(_benchmark_async(table, columns[0], number)))
+    benchmark_database.drop_table(table)
+
+
 def main():
     table = 'tmp_test_script'
     columns = ('a1', 'b2', 'c3')
@@ -147,13 +398,24 @@ def main():
     create_table(table=table, columns_info=columns_info)
     insert_one(table=table, columns=columns, params=params_123)
     insert_all(table=table, columns=columns, seq_params=[params_456, params_789])
+    insert_bulk(table=table, columns=columns, rows=(params for params in [params_456, params_789]))
     select_one(table=table, columns=columns)
     update(table=table, values=dict(zip(columns, params_n123)), columns=columns, params=params_123)
     select_many(table=table, columns=columns)
+    scan(table=table, columns=columns)
     delete(table=table, columns=columns, params=params_456)
     select_all(table=table, columns=columns)
     count(table=table, column=columns[0])
+    approximate_count(table=table, columns=columns, params=params_123)
+    track_count_seeding(table=table, columns=columns, params=params_456)
+    summarize_params()
+    metrics()
     drop_table(table=table)
+    session(table=table, columns_info=columns_info)
+    result_cache(table=table, columns_info=columns_info)
+    async_crud(table=table, columns_info=columns_info)
+    benchmark_bulk_load(table=table, columns_info=columns_info)
+    benchmark_async(table=table, columns_info=columns_info)
 
 
 if __name__ == '__main__':
@@ -9,56 +9,69 @@
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.2
+@Version     : 1.3
 """
-from basic import Logger, DEBUG
+import inspect
+import logging
+import os
+import tempfile
+import time
+import traceback
+from functools import partial, wraps
+from inspect import isfunction
+from multiprocessing import Process, get_all_start_methods, get_context
+
+from basic import Logger, DEBUG, INFO, WARNING, WARN, ERROR, OVERFLOW_DROP_DEBUG, COMPRESSION_GZIP, \
+    iter_struct_log
+from basic.logger import AsyncHandler, LogQueue, OVERFLOW_DROP_OLDEST, RateLimitFilter, TintFormatter
 
 logger = Logger('test_logger', level=DEBUG, simplify=False)
 simplify_path_logger = Logger('test_simplify_path_logger', level=DEBUG, simplify=False, simplify_path=True)
 simplify_logger = Logger('test_simplify_logger', level=DEBUG, simplify=True)
+async_logger = Logger('test_async_logger', level=DEBUG, simplify=False, async_mode=True, overflow=OVERFLOW_DROP_DEBUG)
 
 
-@simplify_logger.info('===============================================================================================')
-@simplify_logger.debug('（调试）装饰器调用 - simplify_logger.debug')
+@simplify_logger.trace(INFO, '=' * 95)
+@simplify_logger.trace(DEBUG, '（调试）装饰器调用 - simplify_logger.trace')
 def test_debug():
     simplify_logger.debug('（调试）函数调用 - simplify_logger.debug')
     simplify_path_logger.debug('（调试）函数调用 - simplify_path_logger.debug')
     logger.debug('（调试）函数调用 - logger.debug')
 
 
-@simplify_logger.info('===============================================================================================')
-@simplify_logger.info('（信息）装饰器调用 - simplify_logger.info')
+@simplify_logger.trace(INFO, '=' * 95)
+@simplify_logger.trace(INFO, '（信息）装饰器调用 - simplify_logger.trace')
 def test_info():
     simplify_logger.info('（信息）函数调用 - simplify_logger.info')
     simplify_path_logger.info('（调试）函数调用 - simplify_path_logger.info')
     logger.info('（信息）函数调用 - logger.info')
 
 
-@simplify_logger.info('===============================================================================================')
-@simplify_logger.warning('（警告）装饰器调用 - simplify_logger.warning')
+@simplify_logger.trace(INFO, '=' * 95)
+@simplify_logger.trace(WARNING, '（警告）装饰器调用 - simplify_logger.trace')
 def test_warning():
     simplify_logger.warning('（警告）函数调用 - simplify_logger.warning')
     simplify_path_logger.warning('（警告）函数调用 - simplify_path_logger.warning')
     logger.warning('（警告）函数调用 - logger.warning')
 
 
-@simplify_logger.info('===============================================================================================')
-@simplify_logger.warn('（警告）装饰器调用 - simplify_logger.warn')
+@simplify_logger.trace(INFO, '=' * 95)
+@simplify_logger.trace(WARN, '（警告）装饰器调用 - simplify_logger.trace')
 def test_warn():
     simplify_logger.warn('（警告）函数调用 - simplify_logger.warn')
     simplify_path_logger.warn('（警告）函数调用 - simplify_path_logger.warn')
     logger.warn('（警告）函数调用 - logger.warn')
 
 
-@simplify_logger.info('===============================================================================================')
-@simplify_logger.error('（错误）装饰器调用 - simplify_logger.error')
+@simplify_logger.trace(INFO, '=' * 95)
+@simplify_logger.trace(ERROR, '（错误）装饰器调用 - simplify_logger.trace')
 def test_error():
     simplify_logger.error('（错误）函数调用 - simplify_logger.error')
     simplify_path_logger.error('（错误）函数调用 - simplify_path_logger.error')
     logger.error('（错误）函数调用 - logger.error')
 
 
-@simplify_logger.info('===============================================================================================')
+@simplify_logger.trace(INFO, '=' * 95)
 def test_exception():
     try:
         raise RuntimeError
@@ -68,20 +81,250 @@ def test_exception():
         logger.exception('（异常）函数调用 - logger.exception')
 
 
-@simplify_logger.info('===============================================================================================')
+@simplify_logger.trace(INFO, '=' * 95)
 def test_critical():
     simplify_logger.critical('（致命）函数调用 - simplify_logger.critical')
     simplify_path_logger.critical('（致命）函数调用 - simplify_path_logger.critical')
     logger.critical('（致命）函数调用 - logger.critical')
 
 
-@simplify_logger.info('===============================================================================================')
+@simplify_logger.trace(INFO, '=' * 95)
 def test_fatal():
     simplify_logger.fatal('（致命）函数调用 - simplify_logger.fatal')
     simplify_path_logger.fatal('（致命）函数调用 - simplify_path_logger.fatal')
     logger.fatal('（致命）函数调用 - logger.fatal')
 
 
+class LocationHandler(logging.Handler):
+    """按 %(filename)s:%(lineno)d 格式记录日志输出的处理器"""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logging.Formatter('%(filename)s:%(lineno)d %(message)s'))
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_caller_location():
+    location_logger = Logger('test_location_logger', level=DEBUG, console=False)
+    handler = LocationHandler()
+    location_logger.logger.addHandler(handler)
+
+    lineno = inspect.currentframe().f_lineno + 1
+    location_logger.info('（信息）函数调用')
+    assert handler.lines[-1] == 'test_logger.py:{} （信息）函数调用'.format(lineno), handler.lines[-1]
+
+    @location_logger.trace(WARNING, '（警告）装饰器调用')
+    def traced():
+        return 'traced'
+
+    lineno = inspect.currentframe().f_lineno + 1
+    assert traced() == 'traced'
+    assert handler.lines[-1] == 'test_logger.py:{} （警告）装饰器调用'.format(lineno), handler.lines[-1]
+
+    # 显式传入被装饰函数时返回包装函数，日志等级未启用时同样返回，仅不输出日志
+    def plain():
+        return 'plain'
+
+    lineno = inspect.currentframe().f_lineno + 1
+    assert location_logger.info('（信息）显式传入函数', plain)() == 'plain'
+    assert handler.lines[-1] == 'test_logger.py:{} （信息）显式传入函数'.format(lineno), handler.lines[-1]
+    location_logger.logger.setLevel(INFO)
+    assert location_logger.debug('（调试）显式传入函数', plain)() == 'plain'
+    assert handler.lines[-1] == 'test_logger.py:{} （信息）显式传入函数'.format(lineno), handler.lines[-1]
+    location_logger.logger.setLevel(DEBUG)
+    location_logger.logger.removeHandler(handler)
+    simplify_logger.info('（信息）调用位置 - %s', handler.lines)
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_async():
+    for i in range(3):
+        async_logger.debug('（调试）异步调用 - async_logger.debug: %s', i)
+        async_logger.info('（信息）异步调用 - async_logger.info: %s', i)
+    async_logger.flush()
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_async_prepare():
+    handler = LocationHandler()
+    async_handler = AsyncHandler([handler])
+    prepare_logger = logging.getLogger('test_async_prepare_logger')
+    prepare_logger.propagate = False
+    prepare_logger.addHandler(async_handler)
+
+    # 入队时已合并日志参数，后续修改参数不影响输出
+    items = ['before']
+    prepare_logger.warning('（警告）异步参数 - %s', items)
+    items[0] = 'after'
+    try:
+        raise RuntimeError('（异常）异步异常')
+    except RuntimeError:
+        prepare_logger.exception('（异常）异步调用')
+    async_handler.flush()
+    assert handler.lines[0].endswith("（警告）异步参数 - ['before']"), handler.lines
+    assert 'RuntimeError: （异常）异步异常' in handler.lines[1], handler.lines
+    prepare_logger.removeHandler(async_handler)
+    async_handler.close()
+
+    # drop_oldest 策略不会丢弃队列中的关闭标记
+    queue = LogQueue(2, OVERFLOW_DROP_OLDEST)
+    for item in ('first', None, 'second', 'third'):
+        queue.put(item if item is None else logging.makeLogRecord({'msg': item, 'levelno': INFO}))
+    assert [record if record is None else record.msg for record in queue.queue] == [None, 'second'], queue.queue
+    simplify_logger.info('（信息）异步预处理 - %s, dropped=%s', handler.lines[0], queue.dropped.variable)
+
+
+def close_logger(target):
+    """移除并关闭日志器的所有处理器，便于删除测试使用的临时目录"""
+    for handler in list(target.logger.handlers):
+        target.logger.removeHandler(handler)
+        handler.close()
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_struct():
+    with tempfile.TemporaryDirectory(prefix='test_struct_logger_') as dirname:
+        filename = os.path.join(dirname, 'test.log')
+        struct_logger = Logger('test_struct_logger', level=DEBUG, console=False, file=filename, file_struct=True)
+        start = time.time()
+        struct_logger.debug('（调试）结构化输出 - struct_logger.debug')
+        struct_logger.info('（信息）结构化输出 - struct_logger.info')
+        struct_logger.warning('（警告）结构化输出 - struct_logger.warning')
+        struct_logger.flush()
+        records = list(iter_struct_log(filename, level=INFO, start=start))
+        close_logger(struct_logger)
+    assert [record.levelno for record in records] == [INFO, WARNING], records
+    for record in records:
+        simplify_logger.info('（信息）结构化读取 - %s:%s %s', record.filename, record.lineno, record.getMessage())
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_rate_limit():
+    rate_limit_logger = Logger(
+        'test_rate_limit_logger', simplify=False, rate_limit=1, rate_burst=3, summary_interval=0.5)
+    handler = LocationHandler()
+    rate_limit_logger.logger.addHandler(handler)
+    for i in range(100):
+        rate_limit_logger.error('（错误）限流调用 - rate_limit_logger.error: %s', i)
+    # 调用位置此后不再输出日志，汇总由后台线程按汇总间隔输出
+    time.sleep(1)
+    rate_limit_logger.logger.removeHandler(handler)
+    assert len(handler.lines) == 4 and 'Suppressed 97 similar messages' in handler.lines[-1], handler.lines
+
+    # 令牌桶数量不超过 max_keys
+    rate_limit_filter = RateLimitFilter(rate=1, burst=1, max_keys=10)
+    for lineno in range(100):
+        rate_limit_filter.filter(logging.makeLogRecord({'name': 'test_rate_limit_filter', 'lineno': lineno}))
+    assert len(rate_limit_filter._buckets) == 10, len(rate_limit_filter._buckets)
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_compressed_rotating():
+    with tempfile.TemporaryDirectory(prefix='test_compressed_rotating_logger_') as dirname:
+        compressed_logger = Logger(
+            'test_compressed_rotating_logger', simplify=False, console=False, file=os.path.join(dirname, 'test.log'),
+            file_max_bytes=1024, file_backup_count=3, file_compression=COMPRESSION_GZIP, file_rotate_interval=60)
+        for i in range(100):
+            compressed_logger.info('（信息）轮转压缩 - compressed_logger.info: %s', i)
+        # 关闭时等待后台线程完成已轮转分段文件的压缩及清理
+        close_logger(compressed_logger)
+        names = sorted(os.listdir(dirname))
+    segments = [name for name in names if name != 'test.log']
+    assert len(segments) == 3 and all(name.endswith('.gz') for name in segments), names
+    simplify_logger.info('（信息）轮转压缩结果 - %s', names)
+
+
+def multiprocess_work(filename, number):
+    multiprocess_logger = Logger('test_multiprocess_logger', simplify=False, file=filename, multiprocess=True)
+    for i in range(number):
+        multiprocess_logger.info('（信息）多进程调用 - multiprocess_logger.info: %s', i)
+
+
+@simplify_logger.trace(INFO, '=' * 95)
+def test_multiprocess():
+    with tempfile.TemporaryDirectory(prefix='test_multiprocess_logger_') as dirname:
+        filename = os.path.join(dirname, 'test.log')
+        multiprocess_work(filename, 3)
+        process_list = []
+        for i in range(3):
+            process_list.append(Process(target=multiprocess_work, args=(filename, 3)))
+        for process in process_list:
+            process.start()
+        for process in process_list:
+            process.join()
+        multiprocess_logger = Logger('test_multiprocess_logger', file=filename, multiprocess=True)
+        if 'fork' in get_all_start_methods():
+            # fork 方式创建的子进程关闭继承的日志处理器时，不检查及等待非自身启动的收集进程
+            process = get_context('fork').Process(target=close_logger, args=(multiprocess_logger,))
+            process.start()
+            process.join()
+            assert process.exitcode == 0, process.exitcode
+        # 关闭时等待收集进程写入全部日志记录后退出
+        close_logger(multiprocess_logger)
+        with open(filename, encoding='utf-8') as f:
+            lines = f.readlines()
+        # 收集进程停止后，之后创建的同名日志器启动新的收集进程，不连接已停止的收集进程
+        restarted_filename = os.path.join(dirname, 'restarted.log')
+        multiprocess_work(restarted_filename, 2)
+        close_logger(Logger('test_multiprocess_logger', file=restarted_filename, multiprocess=True))
+        with open(restarted_filename, encoding='utf-8') as f:
+            restarted_lines = f.readlines()
+    assert len(lines) == 12, lines
+    assert len(restarted_lines) == 2, restarted_lines
+    simplify_logger.info('（信息）多进程输出 - %s lines', len(lines))
+
+
+class LegacyLogger(Logger):
+    """改造前的 debug 方法副本，每次调用通过 traceback.extract_stack 识别装饰器用法，仅用于基准测试对比"""
+
+    def debug(self, msg, *args, stacklevel: int = 2, **kwargs):
+        if traceback.extract_stack()[-2][3].startswith('@') or (args and isfunction(args[-1])):
+            function = None
+            if args and isfunction(args[-1]):
+                *args, function = args
+            if function is None:
+                return partial(self.debug, msg, *args, **kwargs)
+
+            @wraps(function)
+            def wrapped(*func_args, **func_kwargs):
+                self._logger.debug(msg, *args, stacklevel=stacklevel, **kwargs)
+                return function(*func_args, **func_kwargs)
+
+            return wrapped
+        else:
+            self._logger.debug(msg, *args, stacklevel=stacklevel, **kwargs)
+
+
+def benchmark_logger(number=100000):
+    """日志方法调用的微基准测试，分别统计改造前（LegacyLogger）与当前实现在日志等级启用与禁用时的每秒调用次数"""
+    for version, logger_class in (('legacy', LegacyLogger), ('current', Logger)):
+        for name, level in (('enabled', DEBUG), ('disabled', INFO)):
+            target = logger_class('benchmark_{}_{}_logger'.format(version, name),
+                                  level=level, console=False, file=os.devnull)
+            start = time.perf_counter()
+            for i in range(number):
+                target.debug('benchmark %s', i)
+            elapsed = time.perf_counter() - start
+            logger.info('[benchmark_logger] %s %s level: %.0f calls/sec', version, name, number / elapsed)
+
+
+def benchmark_formatter(number=100000):
+    """日志格式化的吞吐量基准测试，模拟一秒内突发 100k 条日志记录"""
+    records = [logging.LogRecord('benchmark_formatter', INFO, __file__, i, 'benchmark %s', (i,), None)
+               for i in range(number)]
+    for color in (False, True):
+        formatter = TintFormatter(color, simplify=False)
+        start = time.perf_counter()
+        for record in records:
+            formatter.format(record)
+        elapsed = time.perf_counter() - start
+        logger.info('[benchmark_formatter] color=%s: %.0f records/sec', color, number / elapsed)
+
+
 def main():
     test_debug()
     test_info()
@@ -91,6 +334,15 @@ def main():
     test_exception()
     test_critical()
     test_fatal()
+    test_caller_location()
+    test_async()
+    test_async_prepare()
+    test_struct()
+    test_rate_limit()
+    test_compressed_rotating()
+    test_multiprocess()
+    benchmark_logger()
+    benchmark_formatter()
 
 
 if __name__ == '__main__':
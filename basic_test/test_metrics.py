@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Author      : YongJie-Xie
+@Contact     : fsswxyj@qq.com
+@DateTime    : 0000-00-00 00:00
+@Description : 多线程指标统计类的测试类
+@FileName    : test_metrics.py
+@License     : MIT License
+@ProjectName : Py3Scripts
+@Software    : PyCharm
+@Version     : 1.1
+"""
+import random
+import time
+from threading import Thread
+
+from basic import Logger, WARNING, Counter, Histogram, HdrHistogram, RateMeter, Timer
+
+logger = Logger('test_metrics', simplify=False)
+
+
+def observe(target, number):
+    for _ in range(number):
+        target.observe(random.random() / 100)
+
+
+@logger.trace(WARNING, 'Testing Histogram Object.')
+def test_histogram():
+    histogram = Histogram()
+    thread_list = []
+    for i in range(3):
+        thread_list.append(Thread(target=observe, args=(histogram, 1000)))
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    snapshot = histogram.snapshot()
+    logger.info('[Histogram] count: %s, sum: %.3f', snapshot['count'], snapshot['sum'])
+    assert snapshot['count'] == snapshot['buckets'][float('inf')] == 3000
+    for line in histogram.prometheus('test_seconds', {'name': 'test'}):
+        logger.info('[Histogram] %s', line)
+
+
+@logger.trace(WARNING, 'Testing HdrHistogram Object.')
+def test_hdr_histogram():
+    histogram = HdrHistogram(significant_figures=2)
+    values = sorted(random.expovariate(100) for _ in range(10000))
+    for value in values:
+        histogram.observe(value)
+    for percent, value in histogram.percentiles((50, 90, 99, 99.9)).items():
+        exact = values[int(percent / 100 * len(values)) - 1]
+        logger.info('[HdrHistogram] p%s: %.6f, exact: %.6f', percent, value, exact)
+        assert abs(value - exact) <= exact * 0.01
+    logger.info('[HdrHistogram] %s', histogram.summary())
+
+
+@logger.trace(WARNING, 'Testing RateMeter and Timer Object.')
+def test_rate_meter():
+    meter, histogram = RateMeter(), HdrHistogram()
+    for _ in range(5):
+        with Timer(histogram, meter) as timer:
+            time.sleep(0.01)
+        assert timer.elapsed >= 0.01
+    assert meter.count == 5 and histogram.snapshot()['count'] == 5
+    logger.info('[RateMeter] %s', meter.summary())
+    logger.info('[Timer] %s', histogram.summary())
+
+
+@logger.trace(WARNING, 'Testing MetricsReporter Object.')
+def test_metrics_reporter():
+    meter, counter = RateMeter(), Counter()
+    reporter = logger.report_metrics({'meter': meter, 'counter': counter}, interval=0.1)
+    for _ in range(100):
+        meter.mark()
+        counter.increase()
+    time.sleep(0.25)
+    reporter.stop()
+
+
+def benchmark_metrics(number=1000000):
+    """记录耗时的基准测试，统计 RateMeter、HdrHistogram 及 Histogram 的每秒记录次数"""
+    for name, record in (
+            ('RateMeter.mark', RateMeter().mark),
+            ('HdrHistogram.observe', lambda observe=HdrHistogram().observe: observe(0.001)),
+            ('Histogram.observe', lambda observe=Histogram().observe: observe(0.001)),
+    ):
+        start = time.perf_counter()
+        for _ in range(number):
+            record()
+        logger.warning('[benchmark_metrics] %s: %.0f records/sec', name, number / (time.perf_counter() - start))
+
+
+def main():
+    test_histogram()
+    test_hdr_histogram()
+    test_rate_meter()
+    test_metrics_reporter()
+    benchmark_metrics()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,23 +9,25 @@
 @License     : MIT License
 @ProjectName : Py3Scripts
 @Software    : PyCharm
-@Version     : 1.0
+@Version     : 1.1
 """
+import multiprocessing
+import sys
 import time
 from threading import Thread
 
-from basic import Logger, SyncVariable, GlobalSyncVariable
+from basic import Logger, WARNING, SyncVariable, GlobalSyncVariable, SharedSyncVariable
 
 logger = Logger('test_variable', simplify=False)
 
 
 def accumulate(target, number):
     for num in range(1, number + 1):
-        target.variable += num
+        target.update(lambda value: value + num)
         logger.info('[%s] num: %s, now: %s', target.__class__.__name__, num, target)
 
 
-@logger.warning('Testing SyncVariable Object.')
+@logger.trace(WARNING, 'Testing SyncVariable Object.')
 def test_sync_variable():
     class TestSyncVariable(SyncVariable):
         def __init__(self):
@@ -40,7 +42,7 @@ def test_sync_variable():
         thread.join()
 
 
-@logger.warning('Testing GlobalSyncVariable Object.')
+@logger.trace(WARNING, 'Testing GlobalSyncVariable Object.')
 def test_global_sync_variable():
     class TestGlobalSyncVariable(GlobalSyncVariable):
         def __init__(self):
@@ -55,10 +57,150 @@ def test_global_sync_variable():
         thread.join()
 
 
+def assign(target, value):
+    target.variable = value
+
+
+@logger.trace(WARNING, 'Testing SharedSyncVariable Object.')
+def test_shared_sync_variable():
+    if sys.version_info < (3, 8):
+        # multiprocessing.shared_memory 需要 Python 3.8 及以上版本
+        logger.warning('Skipped: shared memory requires Python 3.8+')
+        return
+    variable = SharedSyncVariable(0.0, typecode='d')
+    process = multiprocessing.Process(target=assign, args=(variable, 3.14))
+    process.start()
+    process.join()
+    logger.info('[%s] now: %s', variable.__class__.__name__, variable)
+    assert variable.variable == 3.14
+    variable.close()
+    # 格式字符须为单个字符，空串及多个字符组成的子串均不支持
+    for typecode in ('', 'qd', 'Qf'):
+        try:
+            SharedSyncVariable(0, typecode=typecode)
+        except ValueError as e:
+            assert str(e) == '暂不支持的数值类型', e
+        else:
+            raise AssertionError('typecode {!r} 未被拒绝'.format(typecode))
+
+
+class StressSyncVariable(SyncVariable):
+    def __init__(self):
+        super().__init__(0)
+
+
+def stress(target, mode, number):
+    for _ in range(number):
+        if mode == 'variable +=':
+            # 读与写分别加锁，两次加锁之间其他线程的更新会丢失
+            target.variable += 1
+        elif mode == 'update':
+            target.update(lambda value: value + 1)
+        elif mode == 'compare_and_set':
+            while True:
+                value = target.variable
+                if target.compare_and_set(value, value + 1):
+                    break
+        else:
+            with target.locked() as locked:
+                locked.value += 1
+
+
+@logger.trace(WARNING, 'Testing SyncVariable atomic update.')
+def test_atomic_update():
+    variable = StressSyncVariable()
+    assert variable.update(lambda value: value + 5) == 5
+    assert variable.compare_and_set(5, 6) and not variable.compare_and_set(5, 7)
+    assert variable.get_and_set(8) == 6
+    with variable.locked() as locked:
+        locked.value *= 2
+    assert variable.variable == 16
+
+
+def benchmark_atomic_update(number=20000):
+    """多线程读-改-写的压力测试，统计各方式在不同线程数量下的每秒更新次数及丢失的更新次数"""
+    interval = sys.getswitchinterval()
+    # 缩短线程切换间隔以放大竞争
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread_count in (8, 32, 64):
+            for mode in ('variable +=', 'update', 'compare_and_set', 'locked'):
+                variable = StressSyncVariable()
+                thread_list = [Thread(target=stress, args=(variable, mode, number // thread_count))
+                               for _ in range(thread_count)]
+                start = time.perf_counter()
+                for thread in thread_list:
+                    thread.start()
+                for thread in thread_list:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                expected = number // thread_count * thread_count
+                logger.warning('[benchmark_atomic_update] threads=%s, %s: %.0f updates/sec, lost updates: %s',
+                               thread_count, mode, expected / elapsed, expected - variable.variable)
+                if mode != 'variable +=':
+                    assert variable.variable == expected
+    finally:
+        sys.setswitchinterval(interval)
+
+
+class ConfigSyncVariable(SyncVariable):
+    def __init__(self, read_mostly=False):
+        super().__init__({'version': 0}, read_mostly=read_mostly)
+
+
+@logger.trace(WARNING, 'Testing SyncVariable read mostly mode.')
+def test_read_mostly():
+    variable = ConfigSyncVariable(read_mostly=True)
+    snapshot = variable.variable
+    with variable.locked() as locked:
+        locked.value['version'] = 1
+    # 读者持有的旧对象不受写入影响
+    assert snapshot == {'version': 0} and variable.variable == {'version': 1}
+    try:
+        with variable.locked() as locked:
+            locked.value['version'] = 2
+            raise ValueError('丢弃未提交的副本')
+    except ValueError as e:
+        logger.info('[%s] %s, now: %s', variable.__class__.__name__, e, variable)
+    assert variable.update(lambda value: {**value, 'version': 3}) == {'version': 3}
+
+
+def read_heavy(target, number, write_every):
+    for num in range(1, number + 1):
+        if num % write_every:
+            _ = target.variable['version']
+        else:
+            target.update(lambda value: {**value, 'version': value['version'] + 1})
+
+
+def benchmark_read_mostly(number=400000, write_every=1000):
+    """读多写少的基准测试，对比默认模式与读多写少模式在不同线程数量下的每秒操作次数"""
+    for thread_count in (1, 8, 32, 64):
+        for read_mostly in (False, True):
+            variable = ConfigSyncVariable(read_mostly=read_mostly)
+            thread_list = [Thread(target=read_heavy, args=(variable, number // thread_count, write_every))
+                           for _ in range(thread_count)]
+            start = time.perf_counter()
+            for thread in thread_list:
+                thread.start()
+            for thread in thread_list:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            logger.warning('[benchmark_read_mostly] threads=%s, read_mostly=%s: %.0f ops/sec, writes: %s',
+                           thread_count, read_mostly, number // thread_count * thread_count / elapsed,
+                           variable.variable['version'])
+
+
 def main():
     test_sync_variable()
     time.sleep(1)
     test_global_sync_variable()
+    time.sleep(1)
+    test_shared_sync_variable()
+    test_atomic_update()
+    benchmark_atomic_update()
+    test_read_mostly()
+    benchmark_read_mostly()
 
 
 if __name__ == '__main__':